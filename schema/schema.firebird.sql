@@ -5,7 +5,10 @@ CREATE TABLE links (
     via    VARCHAR(1024)            DEFAULT NULL,
     time_c TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
     time_m TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
-    note   BLOB CHARACTER SET UTF8
+    note   BLOB CHARACTER SET UTF8,
+    -- The note rendered as HTML, and the version of the renderer used
+    note_html    BLOB CHARACTER SET UTF8,
+    note_version SMALLINT
 );
 
 CREATE INDEX ix_links_created ON links (time_c);
@@ -15,3 +18,22 @@ CREATE TABLE oembed (
     id     INTEGER                 NOT NULL PRIMARY KEY,
     html   BLOB CHARACTER SET UTF8 NOT NULL
 );
+
+-- Entry counts for each month, kept up to date by the application so that the
+-- archive page needn't scan the links table.
+CREATE TABLE archive_months (
+    year_no  SMALLINT NOT NULL,
+    month_no SMALLINT NOT NULL,
+    n        INTEGER  DEFAULT 0 NOT NULL,
+    PRIMARY KEY (year_no, month_no)
+);
+
+-- The search index: the entries each term appears in, and how heavily.
+CREATE TABLE search_terms (
+    term     VARCHAR(64) CHARACTER SET UTF8 NOT NULL,
+    entry_id INTEGER                        NOT NULL,
+    weight   INTEGER                        NOT NULL,
+    PRIMARY KEY (term, entry_id)
+);
+
+CREATE INDEX ix_search_terms_entry ON search_terms (entry_id);
@@ -7,7 +7,10 @@ CREATE TABLE links (
 	via    TEXT    NULL,
 	time_c TEXT    NOT NULL DEFAULT (DATETIME('now')),
 	time_m TEXT    NOT NULL DEFAULT (DATETIME('now')),
-	note   TEXT    NULL
+	note   TEXT    NULL,
+	-- The note rendered as HTML, and the version of the renderer used
+	note_html    TEXT    NULL,
+	note_version INTEGER NULL
 );
 
 CREATE INDEX links_created ON links (time_c);
@@ -20,3 +23,22 @@ CREATE TABLE oembed (
 	-- We transform the image into HTML
 	html   TEXT    NOT NULL
 );
+
+-- Entry counts for each month, kept up to date by the application so that the
+-- archive page needn't scan the links table.
+CREATE TABLE archive_months (
+	year_no  INTEGER NOT NULL,
+	month_no INTEGER NOT NULL,
+	n        INTEGER NOT NULL DEFAULT 0,
+	PRIMARY KEY (year_no, month_no)
+);
+
+-- The search index: the entries each term appears in, and how heavily.
+CREATE TABLE search_terms (
+	term     TEXT    NOT NULL,
+	entry_id INTEGER NOT NULL,
+	weight   INTEGER NOT NULL,
+	PRIMARY KEY (term, entry_id)
+) WITHOUT ROWID;
+
+CREATE INDEX search_terms_entry ON search_terms (entry_id);
@@ -1,3 +1,9 @@
 INSERT INTO links (title, link, via, note) VALUES ('This is a title', 'https://example.com/', NULL, 'The accompanying note.');
 INSERT INTO links (title, link, via, note) VALUES ('This is another title', NULL, 'https://example.com/', 'And this is another accompanying note.');
 INSERT INTO links (title, link, via, note) VALUES ('This is yet another title', NULL, NULL, 'And this is yet another accompanying note.');
+
+-- Bring the archive counts into line with the entries above.
+INSERT INTO archive_months (year_no, month_no, n)
+SELECT EXTRACT(YEAR FROM time_c), EXTRACT(MONTH FROM time_c), COUNT(*)
+FROM links
+GROUP BY EXTRACT(YEAR FROM time_c), EXTRACT(MONTH FROM time_c);
@@ -29,3 +29,9 @@ INSERT INTO links (
 	DATETIME('now'),
 	'And this is another accompanying note.'
 );
+
+-- Bring the archive counts into line with the entries above.
+INSERT INTO archive_months (year_no, month_no, n)
+SELECT CAST(STRFTIME('%Y', time_c) AS INTEGER), CAST(STRFTIME('%m', time_c) AS INTEGER), COUNT(*)
+FROM links
+GROUP BY 1, 2;
@@ -1,12 +1,17 @@
+import os
+
 from flask import Flask, render_template
+import jinja2
 
-from . import _version, blog, db, extensions, sri
+from . import _version, blog, cli, db, extensions, sri, warmer
 
 
 def create_app(*, testing: bool = False) -> Flask:
     app = Flask(__name__)
     if not testing:
         app.config.from_envvar("KOMOREBI_SETTINGS")
+        # The container image sets this to somewhere under its cache volume.
+        app.config.setdefault("TEMPLATE_CACHE_DIR", os.environ.get("KOMOREBI_TEMPLATE_CACHE_DIR"))
     else:
         app.config.update(
             {
@@ -18,6 +23,7 @@ def create_app(*, testing: bool = False) -> Flask:
             }
         )
     app.config["COMPRESS_REGISTER"] = False  # only compress annotated views
+    app.config["COMPRESS_STREAMS"] = False  # streamed views compress themselves
     app.config["COMPRESS_MIMETYPES"] = [
         "application/json",
         "text/css",
@@ -27,8 +33,11 @@ def create_app(*, testing: bool = False) -> Flask:
         "application/xml",
         "application/atom+xml",
     ]
+    if template_cache_dir := app.config.get("TEMPLATE_CACHE_DIR"):
+        _use_bytecode_cache(app, template_cache_dir)
     app.register_blueprint(blog.blog)
     app.cli.add_command(sri.generate_hashes)
+    app.cli.add_command(cli.komorebi)
     db.init_app(app)
     extensions.cache.init_app(app)
     extensions.compress.init_app(app)
@@ -52,5 +61,37 @@ def create_app(*, testing: bool = False) -> Flask:
     return app
 
 
+def _use_bytecode_cache(app: Flask, path: str) -> None:
+    try:
+        os.makedirs(path, exist_ok=True)
+    except OSError as exc:
+        # Only a slower start is at stake, so don't refuse to start.
+        app.logger.warning("Not caching compiled templates in %s: %s", path, exc)
+        return
+    # This has to happen before anything touches jinja_env, which is only
+    # created once.
+    app.jinja_options = {**app.jinja_options, "bytecode_cache": jinja2.FileSystemBytecodeCache(path)}
+
+
+def precompile_templates(app: Flask) -> list[str]:
+    """Compile every template now rather than when it's first rendered.
+
+    With `TEMPLATE_CACHE_DIR` set, compiled templates are loaded from there
+    if their source hasn't changed, and stored there otherwise.
+
+    Returns:
+        The names of the templates compiled.
+    """
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
 def create_wsgi_app():
-    return create_app().wsgi_app
+    app = create_app()
+    if app.config.get("TEMPLATE_PRECOMPILE", True):
+        precompile_templates(app)
+    # Only when serving, so management commands don't warm the cache too.
+    warmer.init_app(app)
+    return app.wsgi_app
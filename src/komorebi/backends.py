@@ -0,0 +1,380 @@
+"""Storage backends.
+
+A backend hands out connections, takes them back at the end of a request, and
+knows which SQL dialect its database speaks.
+"""
+
+import collections
+import contextlib
+import dataclasses
+import datetime
+import logging
+import sqlite3
+import threading
+import typing as t
+
+import firebirdsql
+from firebirdsql import consts, fbcore
+
+from . import pool
+
+__all__ = [
+    "Backend",
+    "FirebirdBackend",
+    "PrepareStats",
+    "SQLiteBackend",
+    "create_backend",
+]
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class PrepareStats:
+    """How often statements were found already prepared on a connection."""
+
+    hits: int = 0
+    misses: int = 0
+
+
+class StatementCache:
+    """Prepared statements belonging to a single connection, keyed by SQL.
+
+    A statement is checked out while it's executing so that nested uses of the
+    same SQL don't trample one another. The least recently used statements
+    are dropped once there are more than `size` of them.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        *,
+        record: t.Callable[[bool], None],
+        drop: t.Callable[[t.Any], None],
+    ) -> None:
+        self.size = size
+        self._record = record
+        self._drop = drop
+        self._statements: collections.OrderedDict[str, t.Any] = collections.OrderedDict()
+
+    def checkout(self, sql: str) -> t.Any | None:
+        stmt = self._statements.pop(sql, None)
+        self._record(stmt is not None)
+        return stmt
+
+    def checkin(self, sql: str, stmt: t.Any) -> None:
+        if sql in self._statements:
+            # A duplicate prepared while the cached one was checked out.
+            self._drop(stmt)
+            return
+        self._statements[sql] = stmt
+        while len(self._statements) > self.size:
+            _, stmt = self._statements.popitem(last=False)
+            self._drop(stmt)
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+
+class Backend:
+    #: The name used to pick dialect-specific SQL.
+    dialect: t.ClassVar[str]
+    #: Exceptions the driver raises on constraint violations.
+    integrity_errors: t.ClassVar[tuple[type[Exception], ...]]
+
+    def acquire(self) -> t.Any:
+        """Get a connection for the current request."""
+        raise NotImplementedError
+
+    def release(self, conn: t.Any, *, discard: bool = False) -> None:
+        """Take back a connection once its transaction is finished."""
+        raise NotImplementedError
+
+    def adapt(self, args: tuple) -> tuple:
+        """Convert query parameters into something the driver accepts."""
+        return args
+
+    def snapshot(self) -> t.ContextManager[t.Any]:
+        """Get a dedicated connection reading from a single snapshot.
+
+        Everything read through the connection is consistent as of the first
+        read, however long reading takes and whatever's written meanwhile.
+        """
+        raise NotImplementedError
+
+    def __init__(self, config: t.Mapping[str, t.Any]) -> None:
+        self.statement_cache_size = config.get("DB_STATEMENT_CACHE_SIZE", 32)
+        self._prepare_stats = PrepareStats()
+        self._prepare_lock = threading.Lock()
+
+    def pool_stats(self) -> pool.PoolStats | None:
+        return None
+
+    def prepare_stats(self) -> PrepareStats:
+        with self._prepare_lock:
+            return dataclasses.replace(self._prepare_stats)
+
+    def _record_prepare(self, hit: bool) -> None:  # noqa: FBT001
+        with self._prepare_lock:
+            if hit:
+                self._prepare_stats.hits += 1
+            else:
+                self._prepare_stats.misses += 1
+
+    def close(self) -> None:
+        """Close any connections the backend is holding on to."""
+
+
+class _PreparedCursor(fbcore.Cursor):
+    """A cursor that reuses statements already prepared on its connection.
+
+    This leans on firebirdsql internals: closing the cursor only closes the
+    statement's result set rather than dropping it, and the statement is
+    flagged as open again before it's next executed.
+    """
+
+    stmt: fbcore.Statement | None
+
+    def _get_stmt(self, query: str) -> fbcore.Statement:
+        if self.stmt is not None:
+            self.close()
+        self.query = query
+        stmt = self.transaction.connection.statements.checkout(query)
+        if stmt is None:
+            stmt = fbcore.Statement(self.transaction)
+            stmt.prepare(query)
+        elif stmt.stmt_type == consts.isc_info_sql_stmt_select:
+            stmt._is_open = True
+        self.stmt = stmt
+        return stmt
+
+    def close(self) -> None:
+        if self.stmt is not None:
+            stmt, self.stmt = self.stmt, None
+            stmt.close()
+            self.transaction.connection.statements.checkin(self.query, stmt)
+
+
+class _FirebirdConnection(fbcore.Connection):
+    statements: StatementCache
+
+    def cursor(self, factory=_PreparedCursor):
+        return super().cursor(factory)
+
+
+def _drop_statement(stmt: fbcore.Statement) -> None:
+    # Statement.drop() only frees handles with an open cursor.
+    stmt._is_open = True
+    try:
+        stmt.drop()
+    except Exception:
+        logger.debug("Error dropping prepared statement", exc_info=True)
+
+
+class FirebirdBackend(Backend):
+    dialect = "firebird"
+    integrity_errors = (firebirdsql.IntegrityError,)
+
+    def __init__(self, config: t.Mapping[str, t.Any]) -> None:
+        super().__init__(config)
+        self.config = config
+        self.pool: pool.ConnectionPool[firebirdsql.Connection] = pool.ConnectionPool(
+            self.connect,
+            close=lambda conn: conn.close(),
+            ping=self.ping,
+            min_size=config.get("DB_POOL_MIN_SIZE", 1),
+            max_size=config.get("DB_POOL_MAX_SIZE", 10),
+            idle_timeout=config.get("DB_POOL_IDLE_TIMEOUT", 300),
+            wait_timeout=config.get("DB_POOL_TIMEOUT", 10),
+            ping_interval=config.get("DB_POOL_PING_INTERVAL", 30),
+        )
+
+    def connect(self, *, isolation_level: int | None = None) -> firebirdsql.Connection:
+        if isolation_level is None:
+            isolation_level = (
+                consts.ISOLATION_LEVEL_READ_COMMITED_RO
+                if self.config.get("DB_READ_ONLY")
+                else consts.ISOLATION_LEVEL_READ_COMMITED
+            )
+        # This is what firebirdsql.connect() does, but with our own class.
+        conn = _FirebirdConnection(
+            host=self.config.get("DB_HOST", "localhost"),
+            database=self.config["DB_DATABASE"],
+            port=self.config.get("DB_PORT", 3050),
+            user=self.config["DB_USER"],
+            password=self.config["DB_PASSWORD"],
+            isolation_level=isolation_level,
+        )
+        conn._initialize_socket()
+        # The statements live exactly as long as the connection.
+        conn.statements = StatementCache(
+            self.statement_cache_size,
+            record=self._record_prepare,
+            drop=_drop_statement,
+        )
+        return conn
+
+    @staticmethod
+    def ping(conn: firebirdsql.Connection) -> None:
+        if conn.is_disconnect():
+            raise firebirdsql.OperationalError("connection closed")
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT 1 FROM RDB$DATABASE")
+            cur.fetchone()
+        finally:
+            cur.close()
+        conn.rollback()
+
+    def acquire(self) -> firebirdsql.Connection:
+        return self.pool.acquire()
+
+    @contextlib.contextmanager
+    def snapshot(self) -> t.Iterator[firebirdsql.Connection]:
+        # Kept out of the pool, as the pool's connections are read committed.
+        conn = self.connect(isolation_level=consts.ISOLATION_LEVEL_REPEATABLE_READ)
+        try:
+            yield conn
+        finally:
+            try:
+                conn.rollback()
+            finally:
+                conn.close()
+
+    def release(self, conn: firebirdsql.Connection, *, discard: bool = False) -> None:
+        self.pool.release(conn, discard=discard)
+
+    def pool_stats(self) -> pool.PoolStats:
+        return self.pool.stats()
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+def _convert_timestamp(value: bytes) -> datetime.datetime:
+    dt = datetime.datetime.fromisoformat(value.decode("UTF-8"))
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=datetime.UTC)
+
+
+# Columns are tagged with this in queries, e.g., `time_c AS "time_c [timestamptz]"`
+sqlite3.register_converter("timestamptz", _convert_timestamp)
+
+
+class _SQLiteCursor(sqlite3.Cursor):
+    def execute(self, sql: str, parameters=(), /):
+        # SQLite keeps its own statement cache of the same size, so this only
+        # needs to track which statements are in it.
+        statements = self.connection.statements  # type: ignore
+        statements.checkin(sql, statements.checkout(sql) or True)
+        return super().execute(sql, parameters)
+
+
+class _SQLiteConnection(sqlite3.Connection):
+    statements: StatementCache
+
+    def cursor(self, factory=_SQLiteCursor):  # type: ignore
+        return super().cursor(factory)
+
+
+class SQLiteBackend(Backend):
+    """An in-process backend.
+
+    Each thread gets its own long-lived connection. The database is put into
+    WAL mode, so readers on those connections don't block one another or the
+    writer.
+    """
+
+    dialect = "sqlite"
+    integrity_errors = (sqlite3.IntegrityError,)
+
+    def __init__(self, config: t.Mapping[str, t.Any]) -> None:
+        super().__init__(config)
+        self.path = config["DB_DATABASE"]
+        self.read_only = config.get("DB_READ_ONLY", False)
+        self.busy_timeout = int(config.get("DB_BUSY_TIMEOUT", 5) * 1000)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: list[sqlite3.Connection] = []
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_COLNAMES,
+            # Each connection only ever gets used by the thread that created
+            # it, but close() may be called from elsewhere.
+            check_same_thread=False,
+            factory=_SQLiteConnection,
+            cached_statements=self.statement_cache_size,
+        )
+        conn.statements = StatementCache(
+            self.statement_cache_size,
+            record=self._record_prepare,
+            drop=lambda _: None,
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout:d}")
+        conn.execute("PRAGMA foreign_keys = ON")
+        if self.read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextlib.contextmanager
+    def snapshot(self) -> t.Iterator[sqlite3.Connection]:
+        # In WAL mode, a read transaction sees the database as of its first
+        # read until it ends.
+        conn = self.connect()
+        try:
+            conn.execute("BEGIN")
+            yield conn
+        finally:
+            try:
+                conn.rollback()
+            finally:
+                conn.close()
+
+    def release(self, conn: sqlite3.Connection, *, discard: bool = False) -> None:
+        if discard:
+            self._local.conn = None
+            with self._lock:
+                self._connections.remove(conn)
+            conn.close()
+
+    def adapt(self, args: tuple) -> tuple:
+        # Timestamps are stored as UTC text in the same format as SQLite's own
+        # DATETIME() so that they compare correctly.
+        return tuple(
+            arg.astimezone(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S") if isinstance(arg, datetime.datetime) else arg
+            for arg in args
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+        for conn in connections:
+            conn.close()
+
+
+BACKENDS: dict[str, t.Callable[[t.Mapping[str, t.Any]], Backend]] = {
+    "firebird": FirebirdBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def create_backend(config: t.Mapping[str, t.Any]) -> Backend:
+    name = config.get("DB_BACKEND", "firebird")
+    try:
+        factory = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown database backend: {name!r}") from None
+    return factory(config)
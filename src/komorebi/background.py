@@ -0,0 +1,55 @@
+"""Running jobs in a background thread, off the request path.
+
+Both caching streamed responses once they're sent and warming the cache are
+done in one. The thread is started on demand, rather than when the app is
+created, as threads don't survive forking: a worker process forked from one
+that already had it running gets a fresh one the first time it's needed.
+"""
+
+import logging
+import queue
+import threading
+import typing as t
+
+__all__ = [
+    "Worker",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """Runs jobs one at a time, in the order submitted, in a daemon thread.
+
+    A job that raises is logged, and the next one run regardless.
+
+    Args:
+        name: the name of the thread, to tell it apart in logs and dumps
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._queue: queue.Queue[t.Callable[[], t.Any]] = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def submit(self, job: t.Callable[[], t.Any]) -> None:
+        self._queue.put(job)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def join(self) -> None:
+        """Wait for everything submitted so far to be done."""
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                job()
+            except Exception:
+                logger.exception("Background job %r failed in %s", job, self.name)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,257 @@
+"""Baking the site's pages to static files for a web server to serve directly.
+
+Pages are rendered through the application itself, so they're identical to
+what it would serve, and written to files named after their paths, e.g.,
+`/archive` to `archive.html` and `/` to `index.html`. Each file that's worth
+compressing gets `.gz` and `.br` siblings, as used by nginx's `gzip_static`
+and `brotli_static`.
+
+Pages have absolute URLs in them, so they're rendered as if requested through
+the base URL the site is to be served from. Cached responses and fragments
+are keyed without regard to the host, so pages are rendered without them,
+lest any rendered for the live site end up in the bake or vice versa.
+
+A manifest in the output directory records the version of the application,
+the base URL, and the modification time of the most recently changed entry.
+The next bake only renders the pages of entries changed since then, and the
+pages listing them, unless the application has been upgraded or the base URL
+changed in the meantime.
+"""
+
+from concurrent import futures
+import dataclasses
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import tempfile
+import typing as t
+from urllib import parse
+
+from flask import Flask, current_app
+
+from . import _version, caching, compression, db
+
+__all__ = [
+    "MANIFEST",
+    "BakeStats",
+    "bake",
+    "filename_for",
+]
+
+logger = logging.getLogger(__name__)
+
+#: Where the state of the last bake is kept in the output directory.
+MANIFEST = ".komorebi-bake.json"
+
+#: Extensions for pages whose paths lack one, so the server can tell their type.
+EXTENSIONS = {
+    "text/html": ".html",
+    "application/atom+xml": ".atom",
+}
+
+#: Compressed siblings to write, by encoding.
+SIBLINGS = {
+    "gzip": ".gz",
+    "br": ".br",
+}
+
+# Pages listing entries, which need re-rendering whenever any changes.
+_LISTINGS = ("blog.latest", "blog.archive", "blog.feed", "blog.sitemap")
+
+# The app used by each worker process.
+_worker_app: Flask | None = None
+
+
+@dataclasses.dataclass
+class BakeStats:
+    written: int = 0
+    unchanged: int = 0
+    missing: int = 0
+
+    def __iadd__(self, other: "BakeStats") -> t.Self:
+        self.written += other.written
+        self.unchanged += other.unchanged
+        self.missing += other.missing
+        return self
+
+
+def filename_for(path: str, mimetype: str | None) -> str:
+    """Get the name of the file, relative to the output directory, for a page."""
+    name = path.strip("/")
+    if name == "":
+        return "index.html"
+    if pathlib.PurePosixPath(name).suffix == "" and mimetype in EXTENSIONS:
+        name += EXTENSIONS[mimetype]
+    return name
+
+
+def _write(path: pathlib.Path, data: bytes) -> bool:
+    """Replace a file atomically, so it's never served half-written."""
+    try:
+        if path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        # For the web server to read.
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return True
+
+
+def _bake_pages(app: Flask, output: pathlib.Path, base_url: str, paths: list[str]) -> BakeStats:
+    result = BakeStats()
+    client = app.test_client()
+    for path in paths:
+        response = client.get(path, base_url=base_url, buffered=True, environ_overrides={caching.BYPASS: True})
+        if response.status_code != 200:
+            logger.warning("Not baking %s: got %s", path, response.status)
+            result.missing += 1
+            continue
+        target = output / filename_for(path, response.mimetype)
+        with app.app_context():
+            variants = compression.encode_variants(response.data, response.mimetype)
+        changed = _write(target, response.data)
+        for encoding, suffix in SIBLINGS.items():
+            sibling = target.with_name(target.name + suffix)
+            if encoding in variants:
+                changed = _write(sibling, variants[encoding]) or changed
+            else:
+                sibling.unlink(missing_ok=True)
+        if changed:
+            result.written += 1
+        else:
+            result.unchanged += 1
+    return result
+
+
+def _init_worker() -> None:
+    global _worker_app  # noqa: PLW0603
+    # Imported here as the app itself imports this module for its commands.
+    from .app import create_app  # noqa: PLC0415
+
+    _worker_app = create_app()
+
+
+def _bake_in_worker(output: pathlib.Path, base_url: str, paths: list[str]) -> BakeStats:
+    assert _worker_app is not None  # noqa: S101
+    return _bake_pages(_worker_app, output, base_url, paths)
+
+
+def _read_manifest(output: pathlib.Path) -> dict[str, t.Any]:
+    try:
+        manifest = json.loads((output / MANIFEST).read_text())
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logger.warning("Ignoring unreadable bake manifest in %s", output)
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def _pages_to_bake(since: datetime.datetime, base_url: str) -> tuple[list[str], datetime.datetime | None]:
+    """Get the paths of the pages to render for entries changed since a time.
+
+    Modification times are only to the second on some databases, so entries
+    changed at `since` itself are included: one may have changed again since
+    the last bake without its modification time moving on.
+
+    Returns:
+        The paths, and the latest modification time, or `None` if there are
+        no entries to render.
+    """
+    url = parse.urlsplit(base_url)
+    # The paths are relative to the application root, so that's left out.
+    adapter = current_app.url_map.bind(url.netloc, url_scheme=url.scheme)
+    entries = []
+    months = set()
+    latest = None
+    with db.snapshot():
+        for entry in db.query_modified_since(since):
+            entries.append(adapter.build("blog.entry", {"entry_id": entry["id"]}))
+            time_c = entry["time_c"].astimezone(datetime.UTC)
+            months.add((time_c.year, time_c.month))
+            if latest is None or entry["time_m"] > latest:
+                latest = entry["time_m"]
+    if latest is None:
+        return [], None
+    listings = [adapter.build(endpoint, {}) for endpoint in _LISTINGS]
+    month_pages = [
+        adapter.build("blog.month", {"year": f"{year:04d}", "month": f"{month:02d}"}) for year, month in sorted(months)
+    ]
+    return listings + month_pages + entries, latest
+
+
+def _chunks(items: list[str], size: int) -> t.Iterator[list[str]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def bake(
+    output: pathlib.Path,
+    *,
+    base_url: str,
+    full: bool = False,
+    workers: int = 1,
+    chunk_size: int = 100,
+) -> t.Iterator[BakeStats]:
+    """Render the site's pages to static files.
+
+    Args:
+        output: the directory to write to
+        base_url: the URL the site is to be served from, e.g.,
+            `https://example.com/blog/`
+        full: whether to render everything, rather than only what's changed
+            since the last bake
+        workers: how many processes to render pages in; with more than one,
+            each builds its own app with `create_app()`, so `KOMOREBI_SETTINGS`
+            must be set
+        chunk_size: how many pages to hand a worker at once
+
+    Returns:
+        The running totals after each chunk of pages.
+    """
+    manifest = _read_manifest(output)
+    since = datetime.datetime.fromtimestamp(0, tz=datetime.UTC)
+    if (
+        not full
+        and manifest.get("version") == _version.__version__
+        and manifest.get("base_url") == base_url
+        and "modified" in manifest
+    ):
+        since = datetime.datetime.fromisoformat(manifest["modified"])
+    paths, latest = _pages_to_bake(since, base_url)
+    if latest is None:
+        return
+
+    result = BakeStats()
+    if workers <= 1:
+        app = current_app._get_current_object()  # type: ignore
+        for chunk in _chunks(paths, chunk_size):
+            result += _bake_pages(app, output, base_url, chunk)
+            yield dataclasses.replace(result)
+    else:
+        with futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        ) as executor:
+            pending = [
+                executor.submit(_bake_in_worker, output, base_url, chunk) for chunk in _chunks(paths, chunk_size)
+            ]
+            for future in futures.as_completed(pending):
+                result += future.result()
+                yield dataclasses.replace(result)
+
+    manifest = {"version": _version.__version__, "base_url": base_url, "modified": latest.isoformat()}
+    _write(output / MANIFEST, json.dumps(manifest).encode())
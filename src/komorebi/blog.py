@@ -1,21 +1,23 @@
+import dataclasses
 import typing as t
 from urllib import parse
 
-from firebirdsql import IntegrityError
 from flask import (
     Blueprint,
     Response,
     abort,
     current_app,
     flash,
+    jsonify,
     redirect,
     render_template,
     request,
+    stream_template,
     url_for,
 )
 from flask_httpauth import HTTPBasicAuth
 
-from . import db, embeds, formatting, forms
+from . import _version, caching, db, embeds, formatting, forms, fragments, search, tiered
 from .adjunct import passkit
 from .extensions import cache, compress
 from .feed import generate_feed
@@ -25,9 +27,12 @@ from .sitemap import generate_sitemap
 MINUTE = 60
 HOUR = 3600
 DAY = 86400
+WEEK = 7 * DAY
 
 blog = Blueprint("blog", __name__)
 blog.add_app_template_filter(formatting.render_markdown, "markdown")
+blog.add_app_template_filter(formatting.render_note, "render_note")
+blog.add_app_template_global(fragments.render_entries, "render_entries")
 
 auth = HTTPBasicAuth()
 
@@ -40,33 +45,74 @@ def verify_password(username: str, password: str) -> bool:
     return passkit.JSONPasswdFile(passwd_path).check_password(username, password)
 
 
+def _page_key(name: str) -> db.PageKey | None:
+    if (value := request.args.get(name)) is None:
+        return None
+    return db.PageKey.parse(value)
+
+
+def _latest_cache_key() -> str:
+    # Only the page keys matter, so other junk in the query string can't be
+    # used to fill the cache.
+    for name in ("after", "before"):
+        try:
+            key = _page_key(name)
+        except ValueError:
+            # Never cached, as the view rejects it.
+            return "blog.latest:invalid"
+        if key is not None:
+            return f"blog.latest:{name}={key}"
+    return "blog.latest"
+
+
 @blog.route("/")
 @compress.compressed()
-@cache.cached(timeout=HOUR, make_cache_key=lambda: "blog.latest")
-def latest() -> str:
-    return render_template("latest.html", entries=db.query_latest())
+@caching.cached(
+    timeout=DAY,
+    tags=["latest"],
+    make_cache_key=_latest_cache_key,
+    last_modified=db.query_last_modified,
+)
+def latest() -> Response | t.Iterator[str]:
+    try:
+        after = _page_key("after")
+        before = _page_key("before")
+    except ValueError:
+        abort(400)
+    newer: db.PageKey | None = None
+    older: db.PageKey | None = None
+    if after is not None:
+        entries = list(db.query_latest(after=after, limit=db.PAGE_SIZE + 1))
+        # If there's not a page's worth of newer entries, that's the front page.
+        if len(entries) <= db.PAGE_SIZE:
+            return redirect(url_for("blog.latest"))  # type: ignore
+        entries = entries[db.PAGE_SIZE - 1 :: -1]
+        newer, older = db.PageKey.of(entries[0]), db.PageKey.of(entries[-1])
+    else:
+        entries = list(db.query_latest(before=before, limit=db.PAGE_SIZE + 1))
+        has_older = len(entries) > db.PAGE_SIZE
+        del entries[db.PAGE_SIZE :]
+        if before is not None and entries:
+            newer = db.PageKey.of(entries[0])
+        if has_older:
+            older = db.PageKey.of(entries[-1])
+    return stream_template("latest.html", entries=entries, newer=newer, older=older)
 
 
 @blog.route("/archive")
 @compress.compressed()
-@cache.cached(timeout=HOUR)
-def archive() -> str:
-    return render_template("archive.html", entries=process_archive(db.query_archive()))
+@caching.cached(timeout=WEEK, tags=["archive"], last_modified=db.query_last_modified)
+def archive() -> t.Iterator[str]:
+    return stream_template("archive.html", entries=process_archive(db.query_archive()))
 
 
 @blog.route("/sitemap.xml")
 @compress.compressed()
-@cache.cached(timeout=DAY)
+@caching.cached(timeout=WEEK, tags=["sitemap"], last_modified=db.query_last_modified)
 def sitemap() -> Response:
     response = Response(content_type="application/xml; charset=UTF-8")
     response.cache_control.public = True
     response.cache_control.max_age = DAY
-
-    modified = db.query_last_modified()
-    response.last_modified = modified
-    if request.if_modified_since and modified is not None and modified <= request.if_modified_since:
-        return response.make_conditional(request)  # type: ignore
-
     response.set_data(generate_sitemap(entries=db.query_sitemap()))
     return response
 
@@ -102,17 +148,11 @@ def process_archive(records: t.Iterable[db.ArchiveMonth]) -> t.Iterable[db.Archi
 
 @blog.route("/feed")
 @compress.compressed()
-@cache.cached(timeout=5 * MINUTE)
+@caching.cached(timeout=DAY, tags=["latest"], last_modified=db.query_last_modified)
 def feed() -> Response:
     response = Response(content_type="application/atom+xml; charset=UTF-8")
     response.cache_control.public = True
     response.cache_control.max_age = HOUR
-    modified = db.query_last_modified()
-    response.last_modified = modified
-
-    if request.if_modified_since and modified is not None and modified <= request.if_modified_since:
-        return response.make_conditional(request)  # type: ignore
-
     response.set_data(
         generate_feed(
             feed_id=current_app.config["FEED_ID"],
@@ -120,7 +160,7 @@ def feed() -> Response:
             subtitle=current_app.config.get("BLOG_SUBTITLE"),
             author=current_app.config["BLOG_AUTHOR"],
             rights=current_app.config.get("BLOG_RIGHTS"),
-            modified=modified,
+            modified=db.query_last_modified(),
             entries=db.query_latest(),
         )
     )
@@ -130,16 +170,48 @@ def feed() -> Response:
 
 @blog.route("/<string(length=4):year>-<string(length=2):month>", endpoint="month")
 @compress.compressed()
-@cache.cached(timeout=HOUR)
-def render_month(year: str, month: str) -> str:
+@caching.cached(
+    timeout=WEEK,
+    tags=lambda year, month: [f"month:{year}-{month}"],
+    last_modified=db.query_last_modified,
+)
+def render_month(year: str, month: str) -> t.Iterator[str]:
     entries = db.query_month(int(year), int(month))
     if not entries:
         abort(404)
     dt = f"{year}-{month}"
-    return render_template("month.html", entries=entries, dt=dt)
+    return stream_template("month.html", entries=entries, dt=dt)
+
+
+@blog.route("/search")
+@compress.compressed()
+def search_entries() -> str:
+    query = request.args.get("q", "").strip()
+    page = request.args.get("page", 1, type=int)
+    if page < 1:
+        abort(400)
+    entries = []
+    has_more = False
+    if terms := search.query_terms(query):
+        entries = db.search_entries(terms, offset=(page - 1) * db.PAGE_SIZE, limit=db.PAGE_SIZE + 1)
+        has_more = len(entries) > db.PAGE_SIZE
+        del entries[db.PAGE_SIZE :]
+    return render_template("search.html", query=query, entries=entries, page=page, has_more=has_more)
+
+
+def _entry_cache_key() -> str:
+    # Keyed by the row's contents so that a stale page is never served,
+    # however quickly an entry changes; superseded ones expire.
+    entry_id = request.view_args["entry_id"]  # type: ignore
+    if (entry := db.query_entry(entry_id)) is None:
+        # Never cached, as the view rejects it.
+        return f"blog.entry:{entry_id}:missing"
+    return f"blog.entry:{entry_id}:{fragments.digest(entry)}:{_version.__version__}"
 
 
 @blog.route("/<int:entry_id>", endpoint="entry")
+@compress.compressed()
+@caching.cached(timeout=DAY, tags=[], make_cache_key=_entry_cache_key, last_modified=db.query_last_modified)
 def render_entry(entry_id: int) -> str:
     entry = db.query_entry(entry_id)
     if entry is None:
@@ -162,12 +234,11 @@ def add_entry() -> Response | str:
                 via=form.via.data,
                 note=form.note.data,
             )
-        except IntegrityError:
+        except db.IntegrityError:
             flash("That links already exists", "error")
         else:
             if markup:
                 db.add_oembed(entry_id, markup)
-            cache.delete("blog.latest")
 
             return redirect(url_for("blog.entry", entry_id=entry_id))  # type: ignore
     return render_template("entry_edit.html", form=form)
@@ -188,11 +259,32 @@ def edit_entry(entry_id: int) -> Response | str:
             via=form.via.data,
             note=form.note.data,
         )
-        cache.delete("blog.latest")
         return redirect(url_for("blog.entry", entry_id=entry_id))  # type: ignore
     return render_template("entry_edit.html", form=form)
 
 
+@blog.route("/stats")
+@auth.login_required
+def show_stats() -> Response:
+    """Database pool, prepared statement, query timing, and cache statistics."""
+    result: dict[str, t.Any] = {}
+    for name, replica in (("primary", False), ("replica", True)):
+        pool_stats = db.pool_stats(replica=replica)
+        prepare_stats = db.prepare_stats(replica=replica)
+        if prepare_stats is not None:
+            result[name] = {
+                "pool": None if pool_stats is None else dataclasses.asdict(pool_stats),
+                "prepare": dataclasses.asdict(prepare_stats),
+            }
+    result["queries"] = {name: stats.to_dict() for name, stats in db.query_stats().items()}
+    result["markdown"] = dataclasses.asdict(formatting.memo_stats())
+    if isinstance(cache.cache, tiered.TieredCache):
+        result["cache"] = cache.cache.stats()
+    response = jsonify(result)
+    response.cache_control.no_store = True
+    return response
+
+
 @blog.app_template_filter()
 def extract_hostname(url: str) -> str:
     return parse.urlparse(url).netloc
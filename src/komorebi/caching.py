@@ -0,0 +1,423 @@
+"""Caching of views with dependency tags.
+
+Each cached response is stored along with the current version of each tag it
+depends on, such as "latest" or "month:2020-01". Invalidating a tag gives it
+a new version, so any response stored under the old one is treated as a miss
+from then on. That lets cached responses live for a long time while still
+reflecting changes as soon as they're made.
+
+Versions are random tokens rather than counters, so a version evicted from the
+cache can't come back as one a stale response was stored under.
+
+The versions double as validators: a response's ETag is derived from them,
+so conditional requests can be answered without rendering anything.
+
+Responses are cached already compressed in each encoding a client might ask
+for; see `compression`. A view may stream its response, in which case it's
+sent as it's generated when regenerating it, and compressed and cached in
+the background once it's all sent.
+
+Only one request at a time regenerates a given response: others are served
+the copy being replaced, if there is one, or wait briefly for the new one.
+To spread out regeneration, a response is refreshed early with a probability
+that rises as it nears expiry and with how long it took to generate, per
+Vattani et al., "Optimal Probabilistic Cache Stampede Prevention".
+"""
+
+import dataclasses
+import datetime
+import functools
+import hashlib
+import math
+import random
+import secrets
+import tempfile
+import time
+import typing as t
+
+from flask import Response, current_app, has_request_context, make_response, request
+
+from . import _version, background, compression
+from .extensions import cache
+
+__all__ = [
+    "BYPASS",
+    "bypassed",
+    "cached",
+    "invalidate",
+    "make_etag",
+    "not_modified",
+    "tag_versions",
+    "with_validators",
+]
+
+F = t.TypeVar("F", bound=t.Callable[..., t.Any])
+
+#: The longest a request may spend regenerating a response before another
+#: may try, in seconds.
+LOCK_TIMEOUT = 30
+#: How long a request without a copy to fall back on waits for another to
+#: finish regenerating one before giving up and doing it itself.
+WAIT_TIMEOUT = 2.0
+POLL_INTERVAL = 0.05
+#: How long past its expiry a response is kept to be served while it's being
+#: regenerated.
+STALE_TIMEOUT = 300
+#: Higher values make early refreshes more likely.
+EARLY_REFRESH_BETA = 1.0
+#: When set in a request's WSGI environment, the request is rendered afresh
+#: without reading or writing cached responses or fragments, as when baking.
+BYPASS = "komorebi.caching.bypass"
+#: The copy kept of a streamed response as it's sent is held in memory up to
+#: this many bytes, and in a temporary file beyond.
+STREAM_SPOOL_MAX_BYTES = 1024 * 1024
+
+
+def bypassed() -> bool:
+    """Check if the current request is to be rendered without the cache."""
+    return has_request_context() and bool(request.environ.get(BYPASS))
+
+
+def _tag_key(tag: str) -> str:
+    return f"tag:{tag}"
+
+
+def tag_versions(tags: t.Iterable[str]) -> dict[str, str]:
+    """Get the current version of each tag, creating any that are missing."""
+    tags = sorted(set(tags))
+    versions = dict(zip(tags, cache.get_many(*map(_tag_key, tags)), strict=True))
+    for tag, version in versions.items():
+        if version is None:
+            version = secrets.token_hex(8)
+            # Another process may have beaten us to it. Like those set by
+            # `invalidate`, versions mustn't expire, or what's cached under
+            # them would be needlessly treated as stale.
+            if not cache.add(_tag_key(tag), version, timeout=0):
+                version = cache.get(_tag_key(tag)) or version
+            versions[tag] = version
+    return versions
+
+
+def invalidate(tags: t.Iterable[str]) -> None:
+    """Give each tag a new version, invalidating what's cached under it."""
+    if tags := set(tags):
+        cache.set_many({_tag_key(tag): secrets.token_hex(8) for tag in tags}, timeout=0)
+
+
+def make_etag(*parts: str) -> str:
+    """Make an ETag from whatever identifies a version of a response.
+
+    The app's version is mixed in, as a new release may render differently.
+    """
+    digest = hashlib.blake2b(digest_size=12)
+    for part in (*parts, _version.__version__):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _matches(etag: str) -> bool:
+    if request.if_none_match.star_tag:
+        return True
+    # Compression appends the algorithm used to the ETag, e.g., "...:gzip".
+    return any(tag.partition(":")[0] == etag for tag in request.if_none_match.as_set(include_weak=True))
+
+
+def not_modified(etag: str, modified: datetime.datetime | None = None) -> Response | None:
+    """Get a 304 response if the client's copy is current, or else `None`.
+
+    As the standard requires, If-Modified-Since is only considered in the
+    absence of If-None-Match.
+    """
+    if request.if_none_match:
+        matched = _matches(etag)
+    else:
+        since = request.if_modified_since
+        matched = since is not None and modified is not None and modified <= since
+    if not matched:
+        return None
+    return with_validators(Response(status=304), etag, modified)
+
+
+def with_validators(rv: t.Any, etag: str, modified: datetime.datetime | None = None) -> Response:
+    """Make a response from a view's return value with its validators set."""
+    response = make_response(rv)
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+        if modified is not None:
+            response.last_modified = modified
+    return response
+
+
+@dataclasses.dataclass(frozen=True)
+class _Variants:
+    """A cached response, with its body in each encoding."""
+
+    versions: dict[str, str]
+    headers: list[tuple[str, str]]
+    bodies: dict[str, bytes]
+    #: When it expires, as a Unix timestamp.
+    expires: float = 0.0
+    #: How long it took to generate, in seconds.
+    delta: float = 0.0
+
+    @classmethod
+    def of(
+        cls,
+        versions: dict[str, str],
+        headers: list[tuple[str, str]],
+        body: bytes,
+        mimetype: str | None,
+        expires: float,
+        delta: float,
+    ) -> "_Variants":
+        return cls(versions, headers, compression.encode_variants(body, mimetype), expires, delta)
+
+    def is_fresh(self, versions: dict[str, str]) -> bool:
+        """Check if it's current, allowing for it being refreshed early."""
+        if self.versions != versions:
+            return False
+        # Not for anything cryptographic.
+        early = -self.delta * EARLY_REFRESH_BETA * math.log(1.0 - random.random())  # noqa: S311
+        return time.time() + early < self.expires
+
+    def make_response(self, etag: str, modified: datetime.datetime | None) -> Response:
+        encoding = compression.choose_encoding(self.bodies)
+        response = Response(self.bodies[encoding], headers=self.headers)
+        if len(self.bodies) > 1:
+            response.vary.add("Accept-Encoding")
+        if encoding != compression.IDENTITY:
+            response.content_encoding = encoding
+            # Each variant needs its own strong ETag; this is the same suffix
+            # compression on the fly would add.
+            etag = f"{etag}:{encoding}"
+        return with_validators(response, etag, modified)
+
+
+def _headers(response: Response) -> list[tuple[str, str]]:
+    return [(name, value) for name, value in response.headers.items() if name.lower() != "content-length"]
+
+
+#: Caches streamed responses once they're sent.
+_deferred = background.Worker("komorebi-caching")
+
+
+class _Spool:
+    """Keeps a copy of what passes through, spilling it to disk if it's big."""
+
+    def __init__(self, max_bytes: int) -> None:
+        # Closed once it's read, or by `close` if it never is.
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_bytes)  # noqa: SIM115
+
+    def tee(self, chunks: t.Iterable[bytes]) -> t.Iterator[bytes]:
+        for chunk in chunks:
+            self.file.write(chunk)
+            yield chunk
+
+    def read(self) -> bytes:
+        """Get everything that's passed through, then discard the copy."""
+        with self.file:
+            self.file.seek(0)
+            return self.file.read()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _regenerate(
+    view: t.Callable[[], t.Any],
+    key: str,
+    versions: dict[str, str],
+    timeout: int,
+    release: t.Callable[[], t.Any],
+) -> _Variants | Response:
+    """Run a view, caching its response if it's cacheable, then call `release`.
+
+    A streamed response is only cached, and `release` called, once it's sent.
+    """
+    started = time.monotonic()
+    streaming = False
+    try:
+        response = make_response(view())
+        if response.status_code != 200:
+            return response
+        if response.is_streamed:
+            streaming = True
+            return _stream(response, key, versions, timeout, started, release)
+        record = _Variants.of(
+            versions,
+            _headers(response),
+            response.get_data(),
+            response.mimetype,
+            time.time() + timeout,
+            time.monotonic() - started,
+        )
+        cache.set(key, record, timeout=timeout + STALE_TIMEOUT)
+        return record
+    finally:
+        if not streaming:
+            release()
+
+
+def _stream(
+    response: Response,
+    key: str,
+    versions: dict[str, str],
+    timeout: int,
+    started: float,
+    release: t.Callable[[], t.Any],
+) -> Response:
+    """Send a streamed response as it's generated, caching it afterwards.
+
+    It's compressed on the fly in the encoding the client prefers. A copy of
+    it is kept as it's sent, spooled to disk past `STREAM_SPOOL_MAX_BYTES`,
+    and compressed into each variant to be cached in the background once the
+    last of it is sent. The lock is held until it's cached.
+    """
+    app = current_app._get_current_object()  # type: ignore
+    headers = _headers(response)
+    mimetype = response.mimetype
+    encodings = compression.stream_encodings(mimetype)
+    encoding = compression.choose_encoding(encodings)
+    started_sending = False
+
+    def store(copy: _Spool, delta: float) -> None:
+        try:
+            with app.app_context():
+                record = _Variants.of(versions, headers, copy.read(), mimetype, time.time() + timeout, delta)
+                cache.set(key, record, timeout=timeout + STALE_TIMEOUT)
+        finally:
+            release()
+
+    def generate() -> t.Iterator[bytes]:
+        nonlocal started_sending
+        started_sending = True
+        complete = False
+        copy = _Spool(STREAM_SPOOL_MAX_BYTES)
+        try:
+            yield from compression.encode_stream(copy.tee(response.iter_encoded()), encoding)
+            complete = True
+        finally:
+            response.close()
+            if complete:
+                _deferred.submit(functools.partial(store, copy, time.monotonic() - started))
+            else:
+                copy.close()
+                release()
+
+    def close() -> None:
+        # As with a HEAD request, it may never be sent.
+        if not started_sending:
+            response.close()
+            release()
+
+    streamed = Response(generate(), headers=headers)
+    if encodings:
+        streamed.vary.add("Accept-Encoding")
+    if encoding != compression.IDENTITY:
+        streamed.content_encoding = encoding
+    streamed.call_on_close(close)
+    return streamed
+
+
+def _get_or_regenerate(
+    view: t.Callable[[], t.Any],
+    key: str,
+    versions: dict[str, str],
+    timeout: int,
+) -> tuple[_Variants | Response, bool]:
+    """Get a view's cached response, regenerating it if needs be.
+
+    Returns:
+        The cached response, or the view's own if it's not cacheable, and
+        whether it's a stale copy.
+    """
+    record = cache.get(key)
+    if not isinstance(record, _Variants):
+        record = None
+    elif record.is_fresh(versions):
+        return record, False
+
+    lock = f"lock:{key}"
+    locked = cache.add(lock, 1, timeout=LOCK_TIMEOUT)
+    if not locked:
+        # Someone else is regenerating it.
+        if record is not None:
+            return record, True
+        if (record := _wait_for(key, versions)) is not None:
+            return record, False
+    # A streamed response may finish outside of the app context, so this
+    # holds on to the backend itself.
+    release = functools.partial(cache.cache.delete, lock) if locked else _nothing
+    return _regenerate(view, key, versions, timeout, release), False
+
+
+def _nothing() -> None:
+    pass
+
+
+def _wait_for(key: str, versions: dict[str, str]) -> _Variants | None:
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        record = cache.get(key)
+        if isinstance(record, _Variants) and record.versions == versions:
+            return record
+    return None
+
+
+def cached(
+    *,
+    timeout: int,
+    tags: t.Iterable[str] | t.Callable[..., t.Iterable[str]],
+    make_cache_key: t.Callable[[], str] | None = None,
+    last_modified: t.Callable[[], datetime.datetime | None] | None = None,
+) -> t.Callable[[F], F]:
+    """Cache a view's responses until they expire or any of their tags change.
+
+    Only successful responses are cached, along with compressed copies of
+    them. Responses get an ETag derived from the versions of their tags, and
+    a conditional request for a current one gets a 304 without the view being
+    run. Conditional requests are only answered from what's cached, so that
+    nothing that would fail, such as a page that doesn't exist, gets a 304.
+    Only one request at a time runs the view to
+    regenerate a response. A view may stream its response, such as with
+    `flask.stream_template`, so the client gets it as it's rendered.
+
+    Args:
+        timeout: how long to cache a response, in seconds
+        tags: the tags a response depends on, or a function taking the view's
+            arguments and returning them
+        make_cache_key: generates the key to cache a response under; by
+            default, this is based on the request path
+        last_modified: gets the time after which the response can't have
+            changed, for If-Modified-Since
+    """
+
+    def decorator(f: F) -> F:
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if bypassed():
+                return f(*args, **kwargs)
+            versions = tag_versions(tags(*args, **kwargs) if callable(tags) else tags)
+            key = make_cache_key() if make_cache_key is not None else f"view:{request.path}"
+            etag = make_etag(key, *versions.values())
+            modified = last_modified() if last_modified is not None else None
+            result, stale = _get_or_regenerate(functools.partial(f, *args, **kwargs), key, versions, timeout)
+            if isinstance(result, Response):
+                if result.content_encoding is not None:
+                    # It was compressed as it was streamed.
+                    etag = f"{etag}:{result.content_encoding}"
+                return with_validators(result, etag, modified)
+            if stale:
+                # The validators have to match the content, not what's
+                # replacing it.
+                etag = make_etag(key, *result.versions.values())
+                modified = None
+            if (response := not_modified(etag, modified)) is not None:
+                return response
+            return result.make_response(etag, modified)
+
+        return wrapper  # type: ignore
+
+    return decorator
@@ -0,0 +1,109 @@
+"""Management commands, run as `flask --app komorebi komorebi <command>`."""
+
+import contextlib
+import pathlib
+import sys
+from urllib import parse
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from . import baker, db, embeds, exporter, importer
+
+komorebi = AppGroup("komorebi", help="Manage the tumblelog.")
+
+
+@komorebi.command("rebuild-archive", help="Recount the entries in each month")
+def rebuild_archive() -> None:
+    db.rebuild_archive()
+    click.echo("Archive counts rebuilt")
+
+
+@komorebi.command("rebuild-search", help="Rebuild the search index from scratch")
+@click.option("--batch-size", default=100, show_default=True, help="Entries to index per transaction")
+def rebuild_search(batch_size: int) -> None:
+    total = 0
+    for n in db.rebuild_search_index(batch_size=batch_size):
+        total += n
+        click.echo(f"Indexed {total} entries so far")
+    click.echo(f"Indexed {total} entries")
+
+
+@komorebi.command(help="Re-render notes stored with an out-of-date renderer")
+@click.option("--batch-size", default=100, show_default=True, help="Notes to re-render per transaction")
+def rerender(batch_size: int) -> None:
+    total = 0
+    for n in db.rerender_notes(batch_size=batch_size):
+        total += n
+        click.echo(f"Re-rendered {total} notes so far")
+    click.echo(f"Re-rendered {total} notes")
+
+
+@komorebi.command("import", help="Import entries from a JSONL, Atom, or Netscape bookmarks file")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(sorted(importer.READERS)),
+    help="Format of the file, if not obvious from its extension",
+)
+@click.option("--batch-size", default=500, show_default=True, help="Entries to add per transaction")
+@click.option("--workers", default=8, show_default=True, help="Embeds to fetch at once")
+@click.option(
+    "--embeds/--no-embeds", "fetch_embeds", default=True, show_default=True, help="Fetch embeds for imported links"
+)
+def import_entries(path: str, fmt: str | None, batch_size: int, workers: int, fetch_embeds: bool) -> None:  # noqa: FBT001
+    if fmt is None and (fmt := importer.guess_format(path)) is None:
+        raise click.UsageError("Can't tell the format of the file; use --format")
+    with open(path, "rb") as fh:
+        result = importer.ImportStats()
+        for result in importer.import_entries(
+            importer.READERS[fmt](fh),
+            batch_size=batch_size,
+            workers=workers,
+            fetch=embeds.fetch_embed if fetch_embeds else None,
+        ):
+            click.echo(f"Added {result.added} entries so far")
+    click.echo(
+        f"Added {result.added} entries with {result.embeds} embeds; "
+        f"skipped {result.duplicates} duplicates and {result.skipped} unusable entries"
+    )
+
+
+@komorebi.command(help="Export every entry as JSONL or Atom")
+@click.argument("output", type=click.Path(dir_okay=False, allow_dash=True), default="-")
+@click.option("--format", "fmt", type=click.Choice(sorted(exporter.WRITERS)), default="jsonl", show_default=True)
+@click.option("--batch-size", type=int, help="Entries to read at a time; defaults to DB_FETCH_SIZE")
+@click.option("--base-url", help="Base URL for permalinks in Atom output, if SERVER_NAME isn't configured")
+def export(output: str, fmt: str, batch_size: int | None, base_url: str | None) -> None:
+    if fmt == "atom" and base_url is None and current_app.config.get("SERVER_NAME") is None:
+        raise click.UsageError("Atom output needs --base-url or SERVER_NAME to generate permalinks")
+    with contextlib.ExitStack() as stack:
+        # Not click.File, as the XML writer only accepts genuine text streams.
+        out = sys.stdout if output == "-" else stack.enter_context(open(output, "w", encoding="UTF-8"))
+        if base_url is not None:
+            stack.enter_context(current_app.test_request_context(base_url=base_url))
+        stack.enter_context(db.snapshot())
+        n = exporter.WRITERS[fmt](out, db.query_export(batch_size=batch_size))
+    click.echo(f"Exported {n} entries", err=True)
+
+
+@komorebi.command(help="Render every page to static files for the web server to serve directly")
+@click.argument("output", type=click.Path(file_okay=False, writable=True, path_type=pathlib.Path))
+@click.option("--base-url", required=True, help="URL the pages are to be served from, for absolute links")
+@click.option("--full", is_flag=True, help="Render everything, not just what's changed since the last bake")
+@click.option("--workers", default=1, show_default=True, help="Processes to render pages in")
+def bake(output: pathlib.Path, base_url: str, full: bool, workers: int) -> None:  # noqa: FBT001
+    url = parse.urlsplit(base_url)
+    if url.scheme not in ("http", "https") or not url.netloc:
+        raise click.BadParameter("must be an absolute http or https URL", param_hint="--base-url")
+    # Flask builds absolute URLs from SERVER_NAME whenever it's set.
+    if (server_name := current_app.config.get("SERVER_NAME")) is not None and server_name != url.netloc:
+        raise click.BadParameter(f"must be on the configured SERVER_NAME, {server_name}", param_hint="--base-url")
+    result = baker.BakeStats()
+    for result in baker.bake(output, base_url=base_url, full=full, workers=workers):
+        click.echo(f"Baked {result.written + result.unchanged} pages so far")
+    click.echo(
+        f"Wrote {result.written} pages; {result.unchanged} were unchanged and {result.missing} could not be rendered"
+    )
@@ -0,0 +1,150 @@
+"""Compressing cached responses ahead of time.
+
+A cached response is compressed once, at the highest level, into each encoding
+a client might accept, and the variants are cached with it. Serving one then
+costs no more than serving the uncompressed response, so the price of strong
+compression is paid once per change rather than once per request.
+
+A response streamed as it's rendered can't wait for that, so it's compressed
+on the fly at a lower level in the one encoding the client prefers. The
+compressor is flushed after each chunk, so the client can decode whatever
+it's been sent so far without waiting for the rest.
+"""
+
+import gzip
+import typing as t
+import zlib
+
+from flask import current_app, request
+
+from .extensions import compress
+
+# Brotli is only used where available. flask-compress pulls in brotli, or
+# brotlicffi on PyPy, both with the same interface.
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    try:
+        import brotlicffi as brotli  # type: ignore[no-redef]
+    except ImportError:
+        brotli = None  # type: ignore[assignment]
+
+__all__ = [
+    "IDENTITY",
+    "choose_encoding",
+    "encode_stream",
+    "encode_variants",
+    "stream_encodings",
+]
+
+#: The name of the uncompressed variant.
+IDENTITY = "identity"
+
+_ENCODERS: dict[str, t.Callable[[bytes], bytes]] = {
+    "gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+    "deflate": lambda data: zlib.compress(data, 9),
+}
+
+#: Chunks of a streamed response are gathered up until there's at least this
+#: many bytes to send, as each costs a flush of the compressor and a write.
+STREAM_CHUNK_SIZE = 4096
+
+
+class _StreamEncoder(t.Protocol):
+    def encode(self, data: bytes) -> bytes: ...
+
+    def finish(self) -> bytes: ...
+
+
+class _ZlibEncoder:
+    def __init__(self, wbits: int) -> None:
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+
+    def encode(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self) -> None:
+        self._compressor = brotli.Compressor(quality=5)
+
+    def encode(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+_STREAM_ENCODERS: dict[str, t.Callable[[], _StreamEncoder]] = {
+    "gzip": lambda: _ZlibEncoder(zlib.MAX_WBITS | 16),
+    "deflate": lambda: _ZlibEncoder(zlib.MAX_WBITS),
+}
+
+if brotli is not None:
+    _ENCODERS["br"] = lambda data: brotli.compress(data, quality=11)
+    _STREAM_ENCODERS["br"] = _BrotliEncoder
+
+
+def encode_variants(data: bytes, mimetype: str | None) -> dict[str, bytes]:
+    """Get a response body in every encoding that's worth serving.
+
+    Only the configured `COMPRESS_ALGORITHM`s are used, in order of preference,
+    and only for types in `COMPRESS_MIMETYPES` at least `COMPRESS_MIN_SIZE`
+    bytes long.
+    """
+    variants = {IDENTITY: data}
+    config = current_app.config
+    if mimetype in config.get("COMPRESS_MIMETYPES", ()) and len(data) >= config["COMPRESS_MIN_SIZE"]:
+        for encoding in compress.enabled_algorithms:
+            if (encoder := _ENCODERS.get(encoding)) is not None:
+                variants[encoding] = encoder(data)
+    return variants
+
+
+def choose_encoding(variants: t.Iterable[str]) -> str:
+    """Pick the variant best suited to the client's Accept-Encoding.
+
+    Where the client has no preference, the first of the variants that
+    `encode_variants` made wins.
+    """
+    candidates = [encoding for encoding in variants if encoding != IDENTITY]
+    return request.accept_encodings.best_match([*candidates, IDENTITY], default=IDENTITY)
+
+
+def stream_encodings(mimetype: str | None) -> list[str]:
+    """Get the encodings a streamed response could be compressed with.
+
+    As with `encode_variants`, only `COMPRESS_MIMETYPES` are compressed, but
+    as the length of a streamed response isn't known, `COMPRESS_MIN_SIZE`
+    doesn't apply.
+    """
+    if mimetype not in current_app.config.get("COMPRESS_MIMETYPES", ()):
+        return []
+    return [encoding for encoding in compress.enabled_algorithms if encoding in _STREAM_ENCODERS]
+
+
+def encode_stream(chunks: t.Iterable[bytes], encoding: str) -> t.Iterator[bytes]:
+    """Compress a response body as it's generated.
+
+    Chunks are gathered up to `STREAM_CHUNK_SIZE` and compressed together,
+    and whatever's been compressed is sent straight away.
+    """
+    encoder = None if encoding == IDENTITY else _STREAM_ENCODERS[encoding]()
+    pending: list[bytes] = []
+    size = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_CHUNK_SIZE:
+            data = b"".join(pending)
+            pending.clear()
+            size = 0
+            yield data if encoder is None else encoder.encode(data)
+    data = b"".join(pending)
+    if encoder is not None:
+        data = encoder.encode(data) + encoder.finish()
+    if data:
+        yield data
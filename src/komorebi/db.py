@@ -1,85 +1,510 @@
+import contextlib
+import dataclasses
 import datetime
+import functools
+import logging
+import threading
+import time
 import typing as t
+import zlib
 
-import firebirdsql
-from flask import Flask, current_app, g
+from flask import Flask, current_app, g, has_request_context, request
+
+from . import backends, caching, formatting, pool, search, stats
+from .extensions import cache
+
+logger = logging.getLogger(__name__)
 
 Scalar = int | float | str | bytes | datetime.datetime | None
 
 
-def get_connection() -> firebirdsql.Connection:
+class IntegrityError(Exception):
+    """Raised when a write violates a constraint, whatever the backend."""
+
+
+@dataclasses.dataclass(frozen=True)
+class Statement:
+    """SQL text for each dialect that needs its own.
+
+    Dialects without their own text fall back on the Firebird text. The name
+    identifies the statement in timings and logs.
+    """
+
+    firebird: str
+    sqlite: str | None = None
+    name: str | None = None
+
+    def text(self, dialect: str) -> str:
+        return getattr(self, dialect, None) or self.firebird
+
+
+def statement_name(sql: str | Statement) -> str:
+    """Get a name for a statement that's stable across processes.
+
+    Raw SQL is named after its verb and a checksum of its text.
+    """
+    if isinstance(sql, Statement):
+        if sql.name:
+            return sql.name
+        sql = sql.firebird
+    normalized = " ".join(sql.split())
+    verb = normalized.partition(" ")[0].lower()
+    return f"{verb}-{zlib.crc32(normalized.encode()):08x}"
+
+
+# Settings the replica takes from its DB_REPLICA_* equivalents if present.
+_REPLICA_SETTINGS = (
+    "DB_HOST",
+    "DB_PORT",
+    "DB_DATABASE",
+    "DB_USER",
+    "DB_PASSWORD",
+    "DB_POOL_MIN_SIZE",
+    "DB_POOL_MAX_SIZE",
+)
+
+
+class _Databases:
+    """The primary database, and optionally a read-only replica of it.
+
+    Writes are recorded so that reads can go to the primary for a while after
+    one, giving the replica time to catch up.
+
+    Changes to entries are tracked too: each one bumps a generation counter
+    and the last modification time, so that neither needs the database to
+    answer. Other processes' changes are picked up when the remembered time
+    goes stale after `DB_LAST_MODIFIED_TTL` seconds.
+    """
+
+    def __init__(self, config: t.Mapping[str, t.Any]) -> None:
+        self.primary = backends.create_backend(config)
+        self.replica = None
+        if "DB_REPLICA_DATABASE" in config or "DB_REPLICA_HOST" in config:
+            replica_config = dict(config)
+            for name in _REPLICA_SETTINGS:
+                replica_name = name.replace("DB_", "DB_REPLICA_", 1)
+                if replica_name in config:
+                    replica_config[name] = config[replica_name]
+            replica_config["DB_READ_ONLY"] = True
+            self.replica = backends.create_backend(replica_config)
+        self.lag = config.get("DB_REPLICA_LAG", 5)
+        self.last_write = float("-inf")
+        self.timings = stats.Timings()
+        self.slow_query_threshold = config.get("DB_SLOW_QUERY_THRESHOLD")
+
+        self.generation = 0
+        self.last_modified_ttl = config.get("DB_LAST_MODIFIED_TTL", 60)
+        self._last_modified: datetime.datetime | None = None
+        self._last_modified_expires = float("-inf")
+        self._changes_lock = threading.Lock()
+
+    def recently_written(self) -> bool:
+        return time.monotonic() - self.last_write < self.lag
+
+    def changed(self) -> None:
+        """Record that entries were just changed."""
+        with self._changes_lock:
+            self.generation += 1
+            # Rounded up, as HTTP dates are to the second and the database's
+            # own timestamp of the change will be a little earlier than now.
+            now = datetime.datetime.now(datetime.UTC)
+            self._last_modified = now.replace(microsecond=0) + datetime.timedelta(seconds=1)
+            self._last_modified_expires = time.monotonic() + self.last_modified_ttl
+
+    def last_modified(self) -> tuple[datetime.datetime | None, bool, int]:
+        """Get the remembered modification time.
+
+        Returns:
+            The time, whether it's still fresh, and the current generation.
+        """
+        with self._changes_lock:
+            fresh = time.monotonic() < self._last_modified_expires
+            return self._last_modified, fresh, self.generation
+
+    def remember_last_modified(self, modified: datetime.datetime | None, generation: int) -> None:
+        """Remember a modification time read from the database.
+
+        It's ignored if there's been a change since `generation`.
+        """
+        with self._changes_lock:
+            if generation == self.generation:
+                self._last_modified = modified
+                self._last_modified_expires = time.monotonic() + self.last_modified_ttl
+
+    def close(self) -> None:
+        self.primary.close()
+        if self.replica is not None:
+            self.replica.close()
+
+
+_databases_lock = threading.Lock()
+
+
+def _get_databases() -> _Databases:
+    # Created lazily so that nothing touches the database until it's needed.
+    databases = current_app.extensions.get("komorebi.db")
+    if databases is None:
+        with _databases_lock:
+            databases = current_app.extensions.get("komorebi.db")
+            if databases is None:
+                databases = _Databases(current_app.config)
+                current_app.extensions["komorebi.db"] = databases
+    return databases
+
+
+def _get_backend() -> backends.Backend:
+    return _get_databases().primary
+
+
+def get_connection() -> t.Any:
+    """Get a connection to the primary database."""
     if "db" not in g:
-        g.db = firebirdsql.connect(
-            host=current_app.config.get("DB_HOST", "localhost"),
-            database=current_app.config["DB_DATABASE"],
-            port=current_app.config.get("DB_PORT", 3050),
-            user=current_app.config["DB_USER"],
-            password=current_app.config["DB_PASSWORD"],
-        )
+        g.db = _get_backend().acquire()
     return g.db
 
 
+def get_read_connection() -> t.Any:
+    """Get a connection suitable for reads.
+
+    This is the replica, if there is one, but only for safe requests not
+    otherwise using the primary, and not shortly after a write, so that a
+    client redirected after writing sees what it wrote.
+    """
+    if "db_snapshot" in g:
+        return g.db_snapshot
+    databases = _get_databases()
+    if (
+        databases.replica is None
+        or not has_request_context()
+        or request.method not in ("GET", "HEAD")
+        or "db" in g
+        or databases.recently_written()
+    ):
+        return get_connection()
+    if "db_replica" not in g:
+        g.db_replica = databases.replica.acquire()
+    return g.db_replica
+
+
+def _reading_from_replica() -> bool:
+    return get_read_connection() is g.get("db_replica")
+
+
+@contextlib.contextmanager
+def snapshot() -> t.Iterator[None]:
+    """Make reads within the block come from a single snapshot of the primary.
+
+    The snapshot gets a connection of its own, and only reads go through it;
+    writes still use the request's usual connection.
+    """
+    with _get_backend().snapshot() as conn:
+        g.db_snapshot = conn
+        try:
+            yield
+        finally:
+            del g.db_snapshot
+
+
+def _finish(backend: backends.Backend, conn: t.Any, exc: BaseException | None) -> None:
+    discard = False
+    try:
+        if exc is None:
+            conn.commit()
+        else:
+            conn.rollback()
+    except Exception:
+        # Whatever state it's in, it can't safely be reused.
+        discard = True
+        raise
+    finally:
+        backend.release(conn, discard=discard)
+
+
 def close_connection(exc):
-    conn = g.pop("db", None)
-    if conn is not None:
+    if (conn := g.pop("db_replica", None)) is not None:
+        _finish(_get_databases().replica, conn, exc)  # type: ignore
+    if (conn := g.pop("db", None)) is not None:
         try:
-            if exc is None:
-                conn.commit()
-            else:
-                conn.rollback()
+            _finish(_get_backend(), conn, exc)
         finally:
-            conn.close()
+            _flush_invalidations()
+        if g.pop("db_written", False):
+            _get_databases().last_write = time.monotonic()
+
+
+def commit() -> None:
+    """Commit the work done on the primary so far."""
+    if "db" in g:
+        g.db.commit()
+        _flush_invalidations()
+
+
+def _invalidate_entry(entry_id: int, *tags: str) -> None:
+    """Drop an entry from the cache, along with anything tagged with `tags`.
+
+    This only happens once the write is committed, as otherwise a concurrent
+    read could put back what's about to be replaced.
+    """
+    g.setdefault("db_invalidate", set()).add(entry_id)
+    _invalidate_tags(*tags)
+
+
+def _invalidate_tags(*tags: str) -> None:
+    g.setdefault("db_invalidate_tags", set()).update(tags)
+
+
+def _flush_invalidations() -> None:
+    tags = g.pop("db_invalidate_tags", None) or set()
+    entry_ids = g.pop("db_invalidate", None) or set()
+    if tags:
+        caching.invalidate(tags)
+    if entry_ids:
+        cache.delete_many(*map(_entry_cache_key, entry_ids))
+        _get_databases().changed()
+    if tags or entry_ids:
+        for listener in current_app.extensions.get("komorebi.db.listeners", ()):
+            listener(entry_ids, tags)
+
+
+def on_change(app: Flask, listener: t.Callable[[set[int], set[str]], None]) -> None:
+    """Have `listener` called after each committed change.
+
+    It's passed the IDs of the entries changed and the cache tags
+    invalidated, and is called from within the app context that made them.
+    """
+    app.extensions.setdefault("komorebi.db.listeners", []).append(listener)
+
+
+def month_tag(dt: datetime.datetime | datetime.date) -> str:
+    """Get the cache tag for the month page covering the given time."""
+    if isinstance(dt, datetime.datetime):
+        dt = dt.astimezone(datetime.UTC)
+    return f"month:{dt:%Y-%m}"
+
+
+def pool_stats(*, replica: bool = False) -> pool.PoolStats | None:
+    databases = _get_databases()
+    if replica:
+        return None if databases.replica is None else databases.replica.pool_stats()
+    return databases.primary.pool_stats()
+
+
+def prepare_stats(*, replica: bool = False) -> backends.PrepareStats | None:
+    databases = _get_databases()
+    if replica:
+        return None if databases.replica is None else databases.replica.prepare_stats()
+    return databases.primary.prepare_stats()
+
+
+def query_stats() -> dict[str, stats.StatementStats]:
+    """Get the timings of each statement run so far, keyed by name."""
+    return _get_databases().timings.snapshot()
 
 
 def init_app(app: Flask) -> None:
     app.teardown_appcontext(close_connection)
 
 
-def execute(sql: str, args: tuple[Scalar, ...] = ()) -> int | None:
+def _prepare(sql: str | Statement, args: tuple[Scalar, ...]) -> tuple[str, str, tuple]:
+    backend = _get_backend()
+    name = statement_name(sql)
+    if isinstance(sql, Statement):
+        sql = sql.text(backend.dialect)
+    return name, sql, backend.adapt(args)
+
+
+def _record(name: str, sql: str, args: tuple, database: float, conversion: float = 0.0, rows: int = 0) -> None:
+    databases = _get_databases()
+    databases.timings.record(name, database, conversion, rows)
+    threshold = databases.slow_query_threshold
+    if threshold is not None and database + conversion >= threshold:
+        logger.warning(
+            "Slow query %s took %.3fs (%.3fs converting %d rows): %s; args=%r",
+            name,
+            database + conversion,
+            conversion,
+            rows,
+            " ".join(sql.split()),
+            args,
+        )
+
+
+def _columns(cur) -> list[str]:
+    return [desc[0].lower() for desc in cur.description]
+
+
+class Row(tuple):
+    """A result row.
+
+    It's a tuple, but values can also be looked up by column name, either as
+    keys or attributes, through a column map shared by every row in a result
+    set. Each distinct set of columns gets its own subclass; use `_row_type()`
+    to get it.
+    """
+
+    __slots__ = ()
+
+    _columns: t.ClassVar[dict[str, int]] = {}
+
+    def __getitem__(self, key):  # type: ignore
+        if isinstance(key, str):
+            key = self._columns[key]
+        return tuple.__getitem__(self, key)
+
+    def __getattr__(self, name: str) -> t.Any:
+        try:
+            return tuple.__getitem__(self, self._columns[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __reduce__(self):
+        return _make_row, (tuple(self._columns), tuple(self))
+
+    def get(self, key: str, default: t.Any = None) -> t.Any:
+        index = self._columns.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self) -> t.KeysView[str]:
+        return self._columns.keys()
+
+    def _asdict(self) -> dict[str, t.Any]:
+        return dict(zip(self._columns, self, strict=True))
+
+
+@functools.cache
+def _row_type(columns: tuple[str, ...]) -> type[Row]:
+    return type("Row", (Row,), {"__slots__": (), "_columns": {name: i for i, name in enumerate(columns)}})
+
+
+def _make_row(columns: tuple[str, ...], values: tuple) -> Row:
+    return _row_type(columns)(values)
+
+
+def execute(sql: str | Statement, args: tuple[Scalar, ...] = ()) -> int | None:
+    name, sql, args = _prepare(sql, args)
     conn = get_connection()
     cur = conn.cursor()
+    started = time.perf_counter()
     try:
         cur.execute(sql, args)
         if returned := cur.fetchone():
             return returned[0]
+    except _get_backend().integrity_errors as exc:
+        raise IntegrityError(str(exc)) from exc
     finally:
         cur.close()
+        g.db_written = True
+        _record(name, sql, args, time.perf_counter() - started)
     return None
 
 
-def query(sql: str, args: tuple[Scalar, ...] = ()) -> t.Iterator:
-    conn = get_connection()
+def query(
+    sql: str | Statement,
+    args: tuple[Scalar, ...] = (),
+    *,
+    batch_size: int | None = None,
+) -> t.Iterator[Row]:
+    """Stream the results of a query.
+
+    Rows are fetched in batches of `batch_size`, defaulting to `DB_FETCH_SIZE`,
+    so memory use stays flat however big the result set is. The cursor, and
+    with it the connection, stays busy until the iterator is exhausted or
+    closed: use `query_all()` for anything small that's going to be rendered.
+    """
+    name, sql, args = _prepare(sql, args)
+    if batch_size is None:
+        batch_size = current_app.config.get("DB_FETCH_SIZE", 100)
+    conn = get_read_connection()
     cur = conn.cursor()
+    g.db_streams = g.get("db_streams", 0) + 1
+    # Only the time spent here counts, not the time spent by the consumer.
+    database = conversion = 0.0
+    n_rows = 0
     try:
+        started = time.perf_counter()
         cur.execute(sql, args)
-        yield from cur.itermap()
+        row_type = _row_type(tuple(_columns(cur)))
+        while rows := cur.fetchmany(batch_size):
+            fetched = time.perf_counter()
+            database += fetched - started
+            converted = list(map(row_type, rows))
+            n_rows += len(converted)
+            conversion += time.perf_counter() - fetched
+            yield from converted
+            started = time.perf_counter()
+        database += time.perf_counter() - started
     finally:
         cur.close()
+        g.db_streams -= 1
+        _record(name, sql, args, database, conversion, n_rows)
 
 
-def query_row(sql: str, args: tuple[Scalar, ...] = ()) -> dict[str, Scalar] | None:
-    conn = get_connection()
+def query_all(sql: str | Statement, args: tuple[Scalar, ...] = ()) -> list[Row]:
+    """Fetch all the results of a query at once.
+
+    For safe requests, the request's connections are handed back as soon as
+    the rows are in memory rather than being held while the response is
+    rendered. Later queries in the request will check out a fresh one.
+    """
+    name, sql, args = _prepare(sql, args)
+    conn = get_read_connection()
     cur = conn.cursor()
+    started = time.perf_counter()
     try:
         cur.execute(sql, args)
-        if row := cur.fetchonemap():
-            # Hack to get the update form working properly.
-            return {k.lower(): v for k, v in row.items()}
+        row_type = _row_type(tuple(_columns(cur)))
+        fetched = cur.fetchall()
     finally:
         cur.close()
-    return None
+    database = time.perf_counter() - started
+    rows = list(map(row_type, fetched))
+    _record(name, sql, args, database, time.perf_counter() - started - database, len(rows))
+    release_connections()
+    return rows
 
 
-def query_value(sql: str, args: tuple[Scalar, ...] = (), *, default: Scalar = None) -> Scalar:
-    conn = get_connection()
+def release_connections() -> None:
+    """Hand back the connections of a request that hasn't written anything.
+
+    This does nothing while results are still being streamed.
+    """
+    if (
+        has_request_context()
+        and request.method in ("GET", "HEAD")
+        and not g.get("db_written", False)
+        and g.get("db_streams", 0) == 0
+    ):
+        close_connection(None)
+
+
+def query_row(sql: str | Statement, args: tuple[Scalar, ...] = ()) -> dict[str, Scalar] | None:
+    name, sql, args = _prepare(sql, args)
+    conn = get_read_connection()
+    cur = conn.cursor()
+    started = time.perf_counter()
+    try:
+        cur.execute(sql, args)
+        row = cur.fetchone()
+        database = time.perf_counter() - started
+        result = None if row is None else dict(zip(_columns(cur), row, strict=True))
+    finally:
+        cur.close()
+    _record(name, sql, args, database, time.perf_counter() - started - database, int(row is not None))
+    return result
+
+
+def query_value(sql: str | Statement, args: tuple[Scalar, ...] = (), *, default: Scalar = None) -> Scalar:
+    name, sql, args = _prepare(sql, args)
+    conn = get_read_connection()
     cur = conn.cursor()
+    started = time.perf_counter()
     try:
         cur.execute(sql, args)
-        if row := cur.fetchone():
-            return row[0]
+        row = cur.fetchone()
     finally:
         cur.close()
-    return default
+    _record(name, sql, args, time.perf_counter() - started, rows=int(row is not None))
+    return default if row is None else row[0]
 
 
 class Entry(t.TypedDict):
@@ -90,19 +515,140 @@ class Entry(t.TypedDict):
     link: str | None
     via: str | None
     note: str | None
+    # The note rendered as HTML and the version of the renderer used, if any.
+    note_html: t.NotRequired[str | None]
+    note_version: t.NotRequired[int | None]
     html: str | None
 
 
-def query_latest() -> t.Iterator[Entry]:
-    return query(
+#: The number of entries shown on each page of the latest entries.
+PAGE_SIZE = 40
+
+
+class PageKey(t.NamedTuple):
+    """The position of an entry in reverse chronological order."""
+
+    time_c: datetime.datetime
+    id: int
+
+    @classmethod
+    def of(cls, entry: Entry) -> "PageKey":
+        return cls(entry["time_c"], entry["id"])
+
+    @classmethod
+    def parse(cls, value: str) -> "PageKey":
+        """Parse a key of the form `<time_c>,<id>`.
+
+        Raises:
+            ValueError: if the key is malformed
         """
-        SELECT    links.id, time_c, time_m, link, title, via, note, html
+        time_c, _, entry_id = value.rpartition(",")
+        dt = datetime.datetime.fromisoformat(time_c)
+        if dt.tzinfo is None:
+            raise ValueError(f"page key lacks a timezone: {value!r}")
+        return cls(dt, int(entry_id))
+
+    def __str__(self) -> str:
+        return f"{self.time_c.astimezone(datetime.UTC).isoformat()},{self.id}"
+
+
+# The keyset queries below seek on the time_c index rather than using an
+# offset, with the ID breaking any ties, so each page costs the same to fetch
+# no matter how deep into the archive it is.
+
+LATEST = Statement(
+    name="latest",
+    firebird="""
+        SELECT    links.id, time_c, time_m, link, title, via,
+                  note, note_html, note_version, html
         FROM      links
         LEFT JOIN oembed ON links.id = oembed.id
-        ORDER BY  time_c DESC
-        ROWS      40
-        """
-    )
+        ORDER BY  time_c DESC, links.id DESC
+        ROWS      ?
+        """,
+    sqlite="""
+        SELECT    links.id,
+                  time_c AS "time_c [timestamptz]",
+                  time_m AS "time_m [timestamptz]",
+                  link, title, via, note, note_html, note_version, html
+        FROM      links
+        LEFT JOIN oembed ON links.id = oembed.id
+        ORDER BY  time_c DESC, links.id DESC
+        LIMIT     ?
+        """,
+)
+
+LATEST_BEFORE = Statement(
+    name="latest-before",
+    firebird="""
+        SELECT    links.id, time_c, time_m, link, title, via,
+                  note, note_html, note_version, html
+        FROM      links
+        LEFT JOIN oembed ON links.id = oembed.id
+        WHERE     time_c <= ? AND (time_c < ? OR links.id < ?)
+        ORDER BY  time_c DESC, links.id DESC
+        ROWS      ?
+        """,
+    sqlite="""
+        SELECT    links.id,
+                  time_c AS "time_c [timestamptz]",
+                  time_m AS "time_m [timestamptz]",
+                  link, title, via, note, note_html, note_version, html
+        FROM      links
+        LEFT JOIN oembed ON links.id = oembed.id
+        WHERE     time_c <= ? AND (time_c < ? OR links.id < ?)
+        ORDER BY  time_c DESC, links.id DESC
+        LIMIT     ?
+        """,
+)
+
+# Note that this yields entries oldest first.
+LATEST_AFTER = Statement(
+    name="latest-after",
+    firebird="""
+        SELECT    links.id, time_c, time_m, link, title, via,
+                  note, note_html, note_version, html
+        FROM      links
+        LEFT JOIN oembed ON links.id = oembed.id
+        WHERE     time_c >= ? AND (time_c > ? OR links.id > ?)
+        ORDER BY  time_c ASC, links.id ASC
+        ROWS      ?
+        """,
+    sqlite="""
+        SELECT    links.id,
+                  time_c AS "time_c [timestamptz]",
+                  time_m AS "time_m [timestamptz]",
+                  link, title, via, note, note_html, note_version, html
+        FROM      links
+        LEFT JOIN oembed ON links.id = oembed.id
+        WHERE     time_c >= ? AND (time_c > ? OR links.id > ?)
+        ORDER BY  time_c ASC, links.id ASC
+        LIMIT     ?
+        """,
+)
+
+
+def query_latest(
+    *,
+    before: PageKey | None = None,
+    after: PageKey | None = None,
+    limit: int = PAGE_SIZE,
+) -> list[Entry]:
+    """Fetch entries in reverse chronological order.
+
+    Args:
+        before: only fetch entries older than this
+        after: only fetch entries newer than this; these are returned oldest
+            first so that `limit` takes those closest to the key
+        limit: the maximum number of entries to fetch
+    """
+    if after is not None:
+        rows = query_all(LATEST_AFTER, (after.time_c, after.time_c, after.id, limit))
+    elif before is not None:
+        rows = query_all(LATEST_BEFORE, (before.time_c, before.time_c, before.id, limit))
+    else:
+        rows = query_all(LATEST, (limit,))
+    return rows  # type: ignore
 
 
 class ArchiveMonth(t.TypedDict):
@@ -111,17 +657,86 @@ class ArchiveMonth(t.TypedDict):
     n: int
 
 
-def query_archive() -> t.Iterator[ArchiveMonth]:
-    return query(
-        """
-        SELECT   EXTRACT(YEAR FROM time_c) AS "year",
-                 EXTRACT(MONTH FROM time_c) AS "month",
-                 COUNT(*) AS n
+ARCHIVE = Statement(
+    name="archive",
+    firebird="""
+        SELECT   year_no AS "year", month_no AS "month", n
+        FROM     archive_months
+        WHERE    n > 0
+        ORDER BY year_no DESC, month_no ASC
+        """,
+)
+
+
+def query_archive() -> list[ArchiveMonth]:
+    return query_all(ARCHIVE)  # type: ignore
+
+
+ADJUST_ARCHIVE = Statement(
+    name="adjust-archive",
+    firebird="""
+        MERGE INTO archive_months AS am
+        USING (
+            SELECT EXTRACT(YEAR FROM time_c) AS year_no,
+                   EXTRACT(MONTH FROM time_c) AS month_no,
+                   CAST(? AS INTEGER) AS delta
+            FROM   links
+            WHERE  id = ?
+        ) AS src
+        ON am.year_no = src.year_no AND am.month_no = src.month_no
+        WHEN MATCHED THEN
+            UPDATE SET n = am.n + src.delta
+        WHEN NOT MATCHED THEN
+            INSERT (year_no, month_no, n) VALUES (src.year_no, src.month_no, src.delta)
+        """,
+    sqlite="""
+        INSERT
+        INTO   archive_months (year_no, month_no, n)
+        SELECT CAST(STRFTIME('%Y', time_c) AS INTEGER),
+               CAST(STRFTIME('%m', time_c) AS INTEGER),
+               ?
+        FROM   links
+        WHERE  id = ?
+        ON CONFLICT (year_no, month_no) DO UPDATE SET n = n + excluded.n
+        """,
+)
+
+
+def adjust_archive(entry_id: int, delta: int) -> None:
+    """Adjust the count for the month an entry was posted in.
+
+    This must be called in the same transaction as the change to the entry:
+    after inserting it, or before deleting it.
+    """
+    execute(ADJUST_ARCHIVE, (delta, entry_id))
+
+
+REBUILD_ARCHIVE = Statement(
+    name="rebuild-archive",
+    firebird="""
+        INSERT
+        INTO     archive_months (year_no, month_no, n)
+        SELECT   EXTRACT(YEAR FROM time_c), EXTRACT(MONTH FROM time_c), COUNT(*)
         FROM     links
         GROUP BY EXTRACT(YEAR FROM time_c), EXTRACT(MONTH FROM time_c)
-        ORDER BY EXTRACT(YEAR FROM time_c) DESC, EXTRACT(MONTH FROM time_c) ASC
-        """
-    )
+        """,
+    sqlite="""
+        INSERT
+        INTO     archive_months (year_no, month_no, n)
+        SELECT   CAST(STRFTIME('%Y', time_c) AS INTEGER),
+                 CAST(STRFTIME('%m', time_c) AS INTEGER),
+                 COUNT(*)
+        FROM     links
+        GROUP BY 1, 2
+        """,
+)
+
+
+def rebuild_archive() -> None:
+    """Recount the entries in each month from scratch."""
+    execute("DELETE FROM archive_months")
+    execute(REBUILD_ARCHIVE)
+    _invalidate_tags("archive")
 
 
 class SitemapEntry(t.TypedDict):
@@ -129,34 +744,170 @@ class SitemapEntry(t.TypedDict):
     time_m: datetime.datetime
 
 
+SITEMAP = Statement(
+    name="sitemap",
+    firebird="SELECT id, time_m FROM links",
+    sqlite='SELECT id, time_m AS "time_m [timestamptz]" FROM links',
+)
+
+
 def query_sitemap() -> t.Iterator[SitemapEntry]:
-    return query("SELECT id, time_m FROM links")
+    return query(SITEMAP)  # type: ignore
 
 
-def query_month(year: int, month: int) -> t.Iterator[Entry]:
-    dt = datetime.date(year, month, 1).isoformat()
-    return query(
-        """
-        SELECT    links.id, time_c, time_m, link, title, via, note, html
+EXPORT = Statement(
+    name="export",
+    firebird="""
+        SELECT    links.id, time_c, time_m, link, title, via,
+                  note, note_html, note_version, html
+        FROM      links
+        LEFT JOIN oembed ON links.id = oembed.id
+        ORDER BY  links.id
+        """,
+    sqlite="""
+        SELECT    links.id,
+                  time_c AS "time_c [timestamptz]",
+                  time_m AS "time_m [timestamptz]",
+                  link, title, via, note, note_html, note_version, html
+        FROM      links
+        LEFT JOIN oembed ON links.id = oembed.id
+        ORDER BY  links.id
+        """,
+)
+
+
+def query_export(*, batch_size: int | None = None) -> t.Iterator[Entry]:
+    """Stream every entry, oldest first.
+
+    Use within `snapshot()` to get a consistent export.
+    """
+    return query(EXPORT, batch_size=batch_size)  # type: ignore
+
+
+class ModifiedEntry(t.TypedDict):
+    id: int
+    time_c: datetime.datetime
+    time_m: datetime.datetime
+
+
+MODIFIED_SINCE = Statement(
+    name="modified-since",
+    firebird="SELECT id, time_c, time_m FROM links WHERE time_m >= ?",
+    sqlite="""
+        SELECT  id,
+                time_c AS "time_c [timestamptz]",
+                time_m AS "time_m [timestamptz]"
+        FROM    links
+        WHERE   time_m >= ?
+        """,
+)
+
+
+def query_modified_since(since: datetime.datetime) -> t.Iterator[ModifiedEntry]:
+    """Stream the entries modified at or after the given time."""
+    return query(MODIFIED_SINCE, (since,))  # type: ignore
+
+
+MONTH = Statement(
+    name="month",
+    firebird="""
+        SELECT    links.id, time_c, time_m, link, title, via,
+                  note, note_html, note_version, html
         FROM      links
         LEFT JOIN oembed ON links.id = oembed.id
         WHERE     time_c BETWEEN ? AND DATEADD(1 MONTH TO ?)
         ORDER BY  time_c ASC
         """,
-        (dt, dt),
-    )
+    sqlite="""
+        SELECT    links.id,
+                  time_c AS "time_c [timestamptz]",
+                  time_m AS "time_m [timestamptz]",
+                  link, title, via, note, note_html, note_version, html
+        FROM      links
+        LEFT JOIN oembed ON links.id = oembed.id
+        WHERE     time_c >= ? AND time_c < DATE(?, '+1 month')
+        ORDER BY  time_c ASC
+        """,
+)
 
 
-def query_entry(entry_id: int) -> Entry | None:
-    return query_row(
-        """
-        SELECT    links.id, time_c, time_m, link, title, via, note, html
+def query_month(year: int, month: int) -> list[Entry]:
+    dt = datetime.date(year, month, 1).isoformat()
+    return query_all(MONTH, (dt, dt))  # type: ignore
+
+
+ENTRY = Statement(
+    name="entry",
+    firebird="""
+        SELECT    links.id, time_c, time_m, link, title, via,
+                  note, note_html, note_version, html
         FROM      links
         LEFT JOIN oembed ON links.id = oembed.id
         WHERE     links.id = ?
         """,
-        (entry_id,),
-    )  # type: ignore
+    sqlite="""
+        SELECT    links.id,
+                  time_c AS "time_c [timestamptz]",
+                  time_m AS "time_m [timestamptz]",
+                  link, title, via, note, note_html, note_version, html
+        FROM      links
+        LEFT JOIN oembed ON links.id = oembed.id
+        WHERE     links.id = ?
+        """,
+)
+
+
+#: How long entries are cached, and how long the absence of an entry is.
+ENTRY_CACHE_TIMEOUT = 86400
+MISSING_ENTRY_CACHE_TIMEOUT = 600
+
+# Cached in place of entries that don't exist.
+_MISSING = "missing"
+
+
+def _entry_cache_key(entry_id: int) -> str:
+    return f"db.entry:{entry_id}"
+
+
+def query_entry(entry_id: int) -> Entry | None:
+    """Get an entry, going to the database only if it's not cached.
+
+    IDs with no entry are cached too, so scanning through them doesn't reach
+    the database, but only going by the primary: the replica may not have
+    caught up with an entry just added. Writes to an entry drop it from the
+    cache.
+    """
+    key = _entry_cache_key(entry_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return None if cached == _MISSING else cached
+    entry = query_row(ENTRY, (entry_id,))
+    if entry is not None:
+        cache.set(key, entry, timeout=ENTRY_CACHE_TIMEOUT)
+    elif not _reading_from_replica():
+        cache.set(key, _MISSING, timeout=MISSING_ENTRY_CACHE_TIMEOUT)
+    return entry  # type: ignore
+
+
+ADD_ENTRY = Statement(
+    name="add-entry",
+    firebird="""
+        INSERT
+        INTO    links (link, title, via, note, note_html, note_version)
+        VALUES  (?, ?, ?, ?, ?, ?)
+        RETURNING id
+        """,
+)
+
+ADD_ENTRY_AT = Statement(
+    name="add-entry-at",
+    firebird="""
+        INSERT
+        INTO    links (link, title, via, note, note_html, note_version, time_c, time_m)
+        VALUES  (?, ?, ?, ?, ?, ?, ?, ?)
+        RETURNING id
+        """,
+)
 
 
 def add_entry(
@@ -164,7 +915,13 @@ def add_entry(
     title: str,
     via: str | None,
     note: str | None,
+    time_c: datetime.datetime | None = None,
 ) -> int:
+    """Add an entry, returning its ID.
+
+    The entry is timestamped with the current time unless `time_c` is given,
+    as it is when importing entries.
+    """
     if link is not None and link.strip() == "":
         link = None
     if via is not None and via.strip() == "":
@@ -172,18 +929,37 @@ def add_entry(
     if note is not None and note.strip() == "":
         note = None
 
-    return (
-        execute(
-            """
-            INSERT
-            INTO    links (link, title, via, note)
-            VALUES  (?, ?, ?, ?)
-            RETURNING id
-            """,
-            (link, title, via, note),
-        )
-        or 0
+    note_html, note_version = _render_note(note)
+    if time_c is None:
+        sql = ADD_ENTRY
+        args: tuple[Scalar, ...] = (link, title, via, note, note_html, note_version)
+    else:
+        sql = ADD_ENTRY_AT
+        args = (link, title, via, note, note_html, note_version, time_c, time_c)
+    entry_id = execute(sql, args) or 0
+    adjust_archive(entry_id, 1)
+    index_entry(entry_id, title, link, note)
+    # Its absence may have been cached.
+    _invalidate_entry(
+        entry_id,
+        "latest",
+        "archive",
+        "sitemap",
+        month_tag(time_c or datetime.datetime.now(datetime.UTC)),
     )
+    return entry_id
+
+
+def existing_links(links: t.Sequence[str]) -> set[str]:
+    """Find which of the given links already have entries."""
+    found: set[str] = set()
+    # Firebird caps the length of an IN list, so keep each one well short of it.
+    for i in range(0, len(links), 100):
+        chunk = tuple(links[i : i + 100])
+        placeholders = ", ".join("?" * len(chunk))
+        sql = f"SELECT link FROM links WHERE link IN ({placeholders})"  # noqa: S608
+        found.update(row.link for row in query_all(Statement(name="existing-links", firebird=sql), chunk))
+    return found
 
 
 def update_entry(
@@ -200,23 +976,195 @@ def update_entry(
     if note is not None and note.strip() == "":
         note = None
 
-    return execute(
+    note_html, note_version = _render_note(note)
+    result = execute(
         """
         UPDATE  links
         SET     link = ?, title = ?, via = ?, note = ?,
+                note_html = ?, note_version = ?,
                 time_m = CURRENT_TIMESTAMP
         WHERE   id = ?
         """,
-        (link, title, via, note, entry_id),
+        (link, title, via, note, note_html, note_version, entry_id),
     )
+    index_entry(entry_id, title, link, note)
+    _invalidate_entry(entry_id, "latest", "sitemap", *_entry_month_tags(entry_id))
+    return result
+
+
+INDEX_TERM = Statement(
+    name="index-term",
+    firebird="INSERT INTO search_terms (term, entry_id, weight) VALUES (?, ?, ?)",
+)
+
+
+def index_entry(entry_id: int, title: str, link: str | None, note: str | None) -> None:
+    """Replace an entry's terms in the search index."""
+    execute("DELETE FROM search_terms WHERE entry_id = ?", (entry_id,))
+    for term, weight in search.index_terms(title, link, note).items():
+        execute(INDEX_TERM, (term, entry_id, weight))
+
+
+def search_entries(terms: t.Sequence[str], *, offset: int = 0, limit: int = PAGE_SIZE) -> list[Entry]:
+    """Find the entries containing every one of the terms, best matches first.
+
+    Only the search index is scanned; entries are looked up by ID.
+    """
+    if not terms:
+        return []
+    placeholders = ", ".join("?" * len(terms))
+    ranked = f"""
+        SELECT   entry_id, SUM(weight) AS score
+        FROM     search_terms
+        WHERE    term IN ({placeholders})
+        GROUP BY entry_id
+        HAVING   COUNT(*) = ?
+        ORDER BY 2 DESC, entry_id DESC
+        """  # noqa: S608
+    sql = Statement(
+        name="search",
+        firebird=f"""
+            SELECT    links.id, time_c, time_m, link, title, via,
+                      note, note_html, note_version, html
+            FROM      ({ranked} OFFSET ? ROWS FETCH NEXT ? ROWS ONLY) AS ranked
+            JOIN      links ON links.id = ranked.entry_id
+            LEFT JOIN oembed ON links.id = oembed.id
+            ORDER BY  ranked.score DESC, links.id DESC
+            """,  # noqa: S608
+        sqlite=f"""
+            SELECT    links.id,
+                      time_c AS "time_c [timestamptz]",
+                      time_m AS "time_m [timestamptz]",
+                      link, title, via, note, note_html, note_version, html
+            FROM      ({ranked} LIMIT ?, ?) AS ranked
+            JOIN      links ON links.id = ranked.entry_id
+            LEFT JOIN oembed ON links.id = oembed.id
+            ORDER BY  ranked.score DESC, links.id DESC
+            """,  # noqa: S608
+    )
+    return query_all(sql, (*terms, len(terms), offset, limit))  # type: ignore
+
+
+ENTRIES_TO_INDEX = Statement(
+    name="entries-to-index",
+    firebird="""
+        SELECT   id, title, link, note
+        FROM     links
+        WHERE    id > ?
+        ORDER BY id
+        ROWS     ?
+        """,
+    sqlite="""
+        SELECT   id, title, link, note
+        FROM     links
+        WHERE    id > ?
+        ORDER BY id
+        LIMIT    ?
+        """,
+)
+
+
+def rebuild_search_index(*, batch_size: int = 100) -> t.Iterator[int]:
+    """Index every entry afresh.
+
+    Each batch is committed as it's done. This yields the number of entries
+    indexed in each batch.
+    """
+    execute("DELETE FROM search_terms")
+    last_id = 0
+    while rows := query_all(ENTRIES_TO_INDEX, (last_id, batch_size)):
+        for row in rows:
+            for term, weight in search.index_terms(row.title, row.link, row.note).items():
+                execute(INDEX_TERM, (term, row.id, weight))
+        commit()
+        last_id = rows[-1].id
+        yield len(rows)
+
+
+ENTRY_TIME = Statement(
+    name="entry-time",
+    firebird="SELECT time_c FROM links WHERE id = ?",
+    sqlite='SELECT time_c AS "time_c [timestamptz]" FROM links WHERE id = ?',
+)
+
+
+def _entry_month_tags(entry_id: int) -> list[str]:
+    time_c = query_value(ENTRY_TIME, (entry_id,))
+    return [] if time_c is None else [month_tag(time_c)]  # type: ignore
+
+
+def _render_note(note: str | None) -> tuple[str | None, int | None]:
+    if note is None:
+        return None, None
+    return formatting.render_markdown(note), formatting.RENDERER_VERSION
+
+
+STALE_NOTES = Statement(
+    name="stale-notes",
+    firebird="""
+        SELECT   id, note
+        FROM     links
+        WHERE    id > ? AND note IS NOT NULL
+                 AND (note_version IS NULL OR note_version <> ?)
+        ORDER BY id
+        ROWS     ?
+        """,
+    sqlite="""
+        SELECT   id, note
+        FROM     links
+        WHERE    id > ? AND note IS NOT NULL
+                 AND (note_version IS NULL OR note_version <> ?)
+        ORDER BY id
+        LIMIT    ?
+        """,
+)
+
+
+def rerender_notes(*, batch_size: int = 100) -> t.Iterator[int]:
+    """Re-render notes rendered by an older renderer or never rendered at all.
+
+    Each batch is committed as it's done. This yields the number of notes
+    re-rendered in each batch.
+    """
+    last_id = 0
+    while rows := query_all(STALE_NOTES, (last_id, formatting.RENDERER_VERSION, batch_size)):
+        for row in rows:
+            execute(
+                "UPDATE links SET note_html = ?, note_version = ? WHERE id = ?",
+                (formatting.render_markdown(row.note), formatting.RENDERER_VERSION, row.id),
+            )
+            _invalidate_entry(row.id, "latest", *_entry_month_tags(row.id))
+        commit()
+        last_id = rows[-1].id
+        yield len(rows)
+
+
+LAST_MODIFIED = Statement(
+    name="last-modified",
+    firebird="SELECT MAX(time_m) FROM links",
+    sqlite='SELECT MAX(time_m) AS "time_m [timestamptz]" FROM links',
+)
 
 
 def query_last_modified() -> datetime.datetime | None:
-    return query_value("SELECT MAX(time_m) FROM links")  # type: ignore
+    """Get when an entry was last modified.
+
+    This is answered from memory unless the remembered time has gone stale.
+    """
+    databases = _get_databases()
+    modified, fresh, generation = databases.last_modified()
+    if not fresh:
+        modified = query_value(LAST_MODIFIED)  # type: ignore
+        if modified is not None:
+            # HTTP dates are to the second, so anything finer would make it
+            # look modified since whatever date a client sends back.
+            modified = modified.replace(microsecond=0)
+        databases.remember_last_modified(modified, generation)
+    return modified
 
 
 def add_oembed(entry_id: int, html: str) -> int | None:
-    return execute(
+    result = execute(
         """
         INSERT
         INTO    oembed (id, html)
@@ -224,3 +1172,5 @@ def add_oembed(entry_id: int, html: str) -> int | None:
         """,
         (entry_id, html),
     )
+    _invalidate_entry(entry_id, "latest", *_entry_month_tags(entry_id))
+    return result
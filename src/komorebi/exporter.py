@@ -0,0 +1,77 @@
+"""Bulk export of entries as JSONL or Atom.
+
+Entries are written as they're read, so memory use stays flat however many
+there are. The JSONL output can be read back in by the importer.
+"""
+
+import datetime
+import json
+import typing as t
+
+from flask import current_app
+
+from . import db, feed
+from .adjunct import xmlutils
+
+__all__ = [
+    "WRITERS",
+    "write_atom",
+    "write_jsonl",
+]
+
+
+def _format_time(value: datetime.datetime) -> str:
+    return value.astimezone(datetime.UTC).isoformat()
+
+
+def write_jsonl(out: t.TextIO, entries: t.Iterable[db.Entry]) -> int:
+    """Write entries, one JSON object per line, returning how many there were."""
+    n = 0
+    for entry in entries:
+        doc = {
+            "id": entry["id"],
+            "title": entry["title"],
+            "link": entry["link"],
+            "via": entry["via"],
+            "note": entry["note"],
+            "html": entry["html"],
+            "time_c": _format_time(entry["time_c"]),
+            "time_m": _format_time(entry["time_m"]),
+        }
+        out.write(json.dumps(doc, ensure_ascii=False))
+        out.write("\n")
+        n += 1
+    return n
+
+
+def write_atom(out: t.TextIO, entries: t.Iterable[db.Entry]) -> int:
+    """Write entries as an Atom feed, returning how many there were.
+
+    This needs a request context so that permalinks can be generated.
+    """
+    n = 0
+
+    def count() -> t.Iterator[db.Entry]:
+        nonlocal n
+        for entry in entries:
+            n += 1
+            yield entry
+
+    config = current_app.config
+    feed.write_feed(
+        xmlutils.XMLBuilder(out),
+        feed_id=config["FEED_ID"],
+        title=config.get("BLOG_TITLE", "My Weblog"),
+        subtitle=config.get("BLOG_SUBTITLE"),
+        author=config["BLOG_AUTHOR"],
+        rights=config.get("BLOG_RIGHTS"),
+        entries=count(),
+    )
+    out.write("\n")
+    return n
+
+
+WRITERS: dict[str, t.Callable[[t.TextIO, t.Iterable[db.Entry]], int]] = {
+    "jsonl": write_jsonl,
+    "atom": write_atom,
+}
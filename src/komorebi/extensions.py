@@ -8,7 +8,3 @@ __all__ = [
 
 cache = Cache()
 compress = Compress()
-
-# Set up cache for compressed responses.
-compress.cache = cache
-compress.cache_key = lambda request: request.url
@@ -3,7 +3,7 @@ import typing as t
 
 from flask import url_for
 
-from . import db, formatting
+from . import db, formatting, fragments
 from .adjunct import xmlutils
 
 
@@ -16,7 +16,41 @@ def generate_feed(
     rights: str | None = None,
     modified: datetime.datetime | None = None,
 ) -> str:
+    # Each entry's content is cached, so only new entries need rendering.
+    entries = list(entries)
+    rendered = fragments.cached("feed", entries, entry_content)
+    contents = {entry["id"]: content for entry, content in zip(entries, rendered, strict=True)}
     xml = xmlutils.XMLBuilder()
+    write_feed(
+        xml,
+        title,
+        author,
+        feed_id,
+        entries,
+        subtitle=subtitle,
+        rights=rights,
+        modified=modified,
+        content=lambda entry: contents[entry["id"]],
+    )
+    return xml.as_string()
+
+
+def write_feed(
+    xml: xmlutils.XMLBuilder,
+    title: str,
+    author: str,
+    feed_id: str,
+    entries: t.Iterable[db.Entry],
+    subtitle: str | None = None,
+    rights: str | None = None,
+    modified: datetime.datetime | None = None,
+    content: t.Callable[[db.Entry], str] | None = None,
+) -> None:
+    """Write a feed to a builder, which may be writing straight to a file.
+
+    The HTML content of each entry comes from `content`, which defaults to
+    `entry_content`.
+    """
     with xml.within("feed", xmlns="http://www.w3.org/2005/Atom"):
         xml.title(title)
         if subtitle:
@@ -42,11 +76,21 @@ def generate_feed(
         )
 
         for entry in entries:
-            add_entry(xml, feed_id, entry)
-    return xml.as_string()
+            add_entry(xml, feed_id, entry, content=content)
 
 
-def add_entry(xml: xmlutils.XMLBuilder, feed_id: str, entry: db.Entry) -> None:
+def entry_content(entry: db.Entry) -> str:
+    """Render the HTML content of an entry: its embed and its note."""
+    content = f"<div>{entry['html']}</div>" if entry["html"] else ""
+    return content + formatting.render_note(entry)
+
+
+def add_entry(
+    xml: xmlutils.XMLBuilder,
+    feed_id: str,
+    entry: db.Entry,
+    content: t.Callable[[db.Entry], str] | None = None,
+) -> None:
     with xml.within("entry"):
         xml.title(entry["title"])
         xml.published(entry["time_c"].astimezone(datetime.UTC).isoformat())
@@ -60,11 +104,9 @@ def add_entry(xml: xmlutils.XMLBuilder, feed_id: str, entry: db.Entry) -> None:
         if entry["via"]:
             xml.link(rel="via", type="text/html", href=entry["via"])
         if entry["note"] or entry["html"]:
-            content = f"<div>{entry['html']}</div>" if entry["html"] else ""
-            content += formatting.render_markdown(entry["note"])
             attrs = {
                 "type": "html",
                 "xml:lang": "en",
                 "xml:base": permalink,
             }
-            xml.content(content, **attrs)
+            xml.content((content or entry_content)(entry), **attrs)
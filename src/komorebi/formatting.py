@@ -1,26 +1,120 @@
 import contextvars
+import dataclasses
+import hashlib
+import threading
+import typing as t
 
 import markdown
 
+from .lru import LRU
+
+#: Bump this whenever a change to the renderer below alters its output. Notes
+#: stored with an older version are rendered afresh until re-rendered with
+#: `flask komorebi rerender`.
+RENDERER_VERSION = 1
+
+OUTPUT_FORMAT = "html"
+EXTENSIONS = (
+    "smarty",
+    "tables",
+    "attr_list",
+    "def_list",
+    "fenced_code",
+    "admonition",
+)
+
+#: The most memory, going by the length of the markdown and HTML, to spend on
+#: remembering what markdown rendered as.
+MEMO_MAX_BYTES = 4 * 1024 * 1024
+
 _formatter: contextvars.ContextVar[markdown.Markdown] = contextvars.ContextVar("_formatter")
 
 
-def render_markdown(text: str | None) -> str:
-    if text is None:
-        return ""
+@dataclasses.dataclass
+class MemoStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    items: int = 0
+    bytes: int = 0
+
+
+class _Memo:
+    """Rendered markdown, keyed by a digest of it, in a bounded LRU.
+
+    The renderer's configuration goes into each digest, so nothing rendered
+    differently can be mistaken for what's wanted.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self._items = LRU(max_bytes)
+        self._stats = MemoStats()
+        self._lock = threading.Lock()
+        self._config = repr((OUTPUT_FORMAT, EXTENSIONS, markdown.__version__)).encode()
+
+    def key(self, text: str) -> bytes:
+        digest = hashlib.blake2b(self._config, digest_size=16)
+        digest.update(text.encode())
+        return digest.digest()
+
+    def get(self, key: bytes) -> str | None:
+        found, html = self._items.get(key)
+        with self._lock:
+            if found:
+                self._stats.hits += 1
+            else:
+                self._stats.misses += 1
+        return html
+
+    def set(self, key: bytes, text: str, html: str) -> None:
+        self._items.set(key, html, len(text) + len(html))
+
+    def stats(self) -> MemoStats:
+        with self._lock:
+            return dataclasses.replace(
+                self._stats,
+                evictions=self._items.evictions,
+                items=len(self._items),
+                bytes=self._items.size,
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items = LRU(self._items.max_bytes)
+            self._stats = MemoStats()
+
+
+_memo = _Memo(MEMO_MAX_BYTES)
+
+
+def _convert(text: str) -> str:
     try:
         formatter = _formatter.get()
     except LookupError:
-        formatter = markdown.Markdown(
-            output_format="html",
-            extensions=[
-                "smarty",
-                "tables",
-                "attr_list",
-                "def_list",
-                "fenced_code",
-                "admonition",
-            ],
-        )
+        formatter = markdown.Markdown(output_format=OUTPUT_FORMAT, extensions=list(EXTENSIONS))
         _formatter.set(formatter)
     return formatter.reset().convert(text)
+
+
+def render_markdown(text: str | None) -> str:
+    """Render markdown as HTML, remembering the result for next time."""
+    if text is None:
+        return ""
+    key = _memo.key(text)
+    html = _memo.get(key)
+    if html is None:
+        html = _convert(text)
+        _memo.set(key, text, html)
+    return html
+
+
+def memo_stats() -> MemoStats:
+    """Get the hit and miss counts and size of what `render_markdown` remembers."""
+    return _memo.stats()
+
+
+def render_note(entry: t.Mapping[str, t.Any]) -> str:
+    """Get the HTML for an entry's note, preferring what was stored with it."""
+    if entry.get("note_version") == RENDERER_VERSION and entry.get("note_html") is not None:
+        return entry["note_html"]
+    return render_markdown(entry.get("note"))
@@ -0,0 +1,75 @@
+"""Caching of the markup for individual entries.
+
+An entry is rendered the same way on the front page, its month page, its
+permalink page, and in search results, and its content the same way in the
+feed. Each rendering is cached on its own, so a page that isn't cached only
+needs to stitch together those of its entries.
+
+Fragments are keyed by a digest of the entry's row, so a change to any of
+its columns, or to its embed, gives it a new key, and by the app's version,
+so a new release's templates are picked up. As they contain URLs, they're
+keyed by the root URL they're requested through too. Superseded fragments
+expire.
+"""
+
+import hashlib
+import typing as t
+
+from flask import get_template_attribute, has_request_context, request
+from markupsafe import Markup
+
+from . import _version, caching
+from .extensions import cache
+
+__all__ = [
+    "FRAGMENT_TIMEOUT",
+    "cached",
+    "digest",
+    "render_entries",
+]
+
+#: How long, in seconds, a fragment is kept once it's rendered, whether or not
+#: it's used in the meantime.
+FRAGMENT_TIMEOUT = 7 * 86400
+
+
+def digest(entry: t.Mapping[str, t.Any]) -> str:
+    """Get a digest of an entry's row that changes whenever the entry does."""
+    columns = [(key, entry[key]) for key in sorted(entry.keys())]
+    return hashlib.blake2b(repr(columns).encode(), digest_size=8).hexdigest()
+
+
+def _key(kind: str, entry: t.Mapping[str, t.Any]) -> str:
+    root = request.url_root if has_request_context() else ""
+    return f"fragment:{kind}:{entry['id']}:{digest(entry)}:{_version.__version__}:{root}"
+
+
+def cached(
+    kind: str,
+    entries: t.Sequence[t.Mapping[str, t.Any]],
+    render: t.Callable[[t.Any], str],
+) -> list[str]:
+    """Get the fragment of each entry, rendering any not in the cache.
+
+    Args:
+        kind: what sort of fragment it is, as one entry has several
+        entries: the entries to get the fragments of
+        render: renders the fragment of a single entry
+    """
+    if caching.bypassed():
+        return [str(render(entry)) for entry in entries]
+    keys = [_key(kind, entry) for entry in entries]
+    fragments = cache.get_many(*keys) if keys else []
+    missed = {}
+    for i, (key, entry) in enumerate(zip(keys, entries, strict=True)):
+        if fragments[i] is None:
+            fragments[i] = missed[key] = str(render(entry))
+    if missed:
+        cache.set_many(missed, timeout=FRAGMENT_TIMEOUT)
+    return fragments
+
+
+def render_entries(entries: t.Sequence[t.Mapping[str, t.Any]]) -> Markup:
+    """Render entries as `macros.entry` would, one after the other."""
+    macro = get_template_attribute("macros.html", "entry")
+    return Markup("\n").join(map(Markup, cached("entry", entries, macro)))
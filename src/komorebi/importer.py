@@ -0,0 +1,291 @@
+"""Bulk import of entries from JSONL, Atom, and Netscape bookmark files.
+
+Each reader streams entries from a file so that memory use stays flat however
+large it is. Entries are then written in batches, one transaction per batch,
+with embeds for each batch fetched concurrently beforehand so that slow sites
+don't hold a transaction open.
+"""
+
+from concurrent import futures
+import dataclasses
+import datetime
+import html.parser
+import json
+import logging
+import typing as t
+from xml.etree import ElementTree as ET
+
+from . import db, embeds
+
+__all__ = [
+    "READERS",
+    "ImportStats",
+    "ImportedEntry",
+    "guess_format",
+    "import_entries",
+    "read_atom",
+    "read_jsonl",
+    "read_netscape",
+]
+
+logger = logging.getLogger(__name__)
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+
+
+@dataclasses.dataclass
+class ImportedEntry:
+    title: str
+    link: str | None = None
+    via: str | None = None
+    note: str | None = None
+    time_c: datetime.datetime | None = None
+
+
+@dataclasses.dataclass
+class ImportStats:
+    added: int = 0
+    duplicates: int = 0
+    skipped: int = 0
+    embeds: int = 0
+
+
+def _parse_time(value: str | None) -> datetime.datetime | None:
+    if not value:
+        return None
+    dt = datetime.datetime.fromisoformat(value)
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=datetime.UTC)
+
+
+def _make_entry(
+    title: str | None,
+    link: str | None,
+    via: str | None = None,
+    note: str | None = None,
+    time_c: datetime.datetime | None = None,
+) -> ImportedEntry | None:
+    title = (title or "").strip() or link
+    if not title:
+        return None
+    return ImportedEntry(title=title, link=link or None, via=via or None, note=note, time_c=time_c)
+
+
+def read_jsonl(fh: t.BinaryIO) -> t.Iterator[ImportedEntry | None]:
+    """Read entries, one JSON object per line, with the same fields as `links`.
+
+    Entries that can't be imported are yielded as `None` so they can be
+    counted as skipped.
+    """
+    for line in fh:
+        if not line.strip():
+            continue
+        doc = json.loads(line)
+        yield _make_entry(
+            title=doc.get("title"),
+            link=doc.get("link"),
+            via=doc.get("via"),
+            note=doc.get("note"),
+            time_c=_parse_time(doc.get("time_c")),
+        )
+
+
+def read_atom(fh: t.BinaryIO) -> t.Iterator[ImportedEntry | None]:
+    """Read entries from an Atom feed such as the one on `/feed`."""
+    # The file comes from whoever's running the import, so it's trusted.
+    for _, elem in ET.iterparse(fh):  # noqa: S314
+        if elem.tag != f"{ATOM_NS}entry":
+            continue
+        links = {link.get("rel", "alternate"): link.get("href") for link in elem.iterfind(f"{ATOM_NS}link")}
+        content = elem.find(f"{ATOM_NS}content")
+        if content is None:
+            content = elem.find(f"{ATOM_NS}summary")
+        yield _make_entry(
+            title=elem.findtext(f"{ATOM_NS}title"),
+            link=links.get("alternate"),
+            via=links.get("via"),
+            note=None if content is None else content.text,
+            time_c=_parse_time(elem.findtext(f"{ATOM_NS}published") or elem.findtext(f"{ATOM_NS}updated")),
+        )
+        elem.clear()
+
+
+class _BookmarkParser(html.parser.HTMLParser):
+    """Pulls bookmarks out of the Netscape bookmark file format.
+
+    Each bookmark is an `<A>` element in a `<DT>`, optionally followed by a
+    `<DD>` with a description. Neither `<DT>` nor `<DD>` is ever closed.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.entries: list[ImportedEntry | None] = []
+        self._current: dict[str, t.Any] | None = None
+        self._text: list[str] | None = None
+        self._in_description = False
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if tag == "a":
+            self._flush()
+            attributes = dict(attrs)
+            added = attributes.get("add_date")
+            self._current = {
+                "link": attributes.get("href"),
+                "time_c": (
+                    datetime.datetime.fromtimestamp(int(added), tz=datetime.UTC) if added and added.isdigit() else None
+                ),
+            }
+            self._text = []
+        elif tag == "dd" and self._current is not None:
+            self._in_description = True
+            self._text = []
+        elif tag in ("dt", "dl", "h3"):
+            self._flush()
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "a" and self._current is not None and self._text is not None:
+            self._current["title"] = "".join(self._text)
+            self._text = None
+        elif tag == "dl":
+            self._flush()
+
+    def handle_data(self, data: str) -> None:
+        if self._text is not None:
+            self._text.append(data)
+
+    def close(self) -> None:
+        super().close()
+        self._flush()
+
+    def _flush(self) -> None:
+        if self._current is not None:
+            note = "".join(self._text).strip() if self._in_description and self._text else None
+            self.entries.append(
+                _make_entry(
+                    title=self._current.get("title"),
+                    link=self._current["link"],
+                    note=note or None,
+                    time_c=self._current["time_c"],
+                )
+            )
+        self._current = None
+        self._text = None
+        self._in_description = False
+
+
+def read_netscape(fh: t.BinaryIO) -> t.Iterator[ImportedEntry | None]:
+    """Read entries from a bookmarks file as exported by most browsers."""
+    parser = _BookmarkParser()
+    for line in fh:
+        parser.feed(line.decode("UTF-8"))
+        yield from parser.entries
+        parser.entries.clear()
+    parser.close()
+    yield from parser.entries
+
+
+READERS: dict[str, t.Callable[[t.BinaryIO], t.Iterator[ImportedEntry | None]]] = {
+    "jsonl": read_jsonl,
+    "atom": read_atom,
+    "netscape": read_netscape,
+}
+
+_EXTENSIONS = {
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".atom": "atom",
+    ".xml": "atom",
+    ".html": "netscape",
+    ".htm": "netscape",
+}
+
+
+def guess_format(filename: str) -> str | None:
+    """Guess the format of a file from its extension."""
+    for extension, name in _EXTENSIONS.items():
+        if filename.lower().endswith(extension):
+            return name
+    return None
+
+
+def _batches(entries: t.Iterable[ImportedEntry | None], size: int, result: ImportStats) -> t.Iterator[list]:
+    batch = []
+    for entry in entries:
+        if entry is None:
+            result.skipped += 1
+            continue
+        batch.append(entry)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _fetch_embed(fetch: t.Callable[[str], str | None], url: str) -> str | None:
+    try:
+        return fetch(url)
+    except Exception:
+        logger.warning("Could not fetch embed for %s", url, exc_info=True)
+        return None
+
+
+def import_entries(
+    entries: t.Iterable[ImportedEntry | None],
+    *,
+    batch_size: int = 500,
+    workers: int = 8,
+    fetch: t.Callable[[str], str | None] | None = embeds.fetch_embed,
+) -> t.Iterator[ImportStats]:
+    """Add entries to the database in batches.
+
+    Entries whose links are already present, whether in the database or
+    earlier in the import, are skipped. Each batch is committed separately.
+
+    Args:
+        entries: the entries to import
+        batch_size: the number of entries in each transaction
+        workers: the most embeds to fetch at once
+        fetch: gets the embed markup for a link, or `None` to skip embeds
+
+    Returns:
+        The running totals after each batch.
+    """
+    result = ImportStats()
+    seen: set[str] = set()
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in _batches(entries, batch_size, result):
+            existing = db.existing_links([entry.link for entry in batch if entry.link is not None])
+            fresh = []
+            for entry in batch:
+                if entry.link is not None:
+                    if entry.link in existing or entry.link in seen:
+                        result.duplicates += 1
+                        continue
+                    seen.add(entry.link)
+                fresh.append(entry)
+
+            # Fetched before writing anything so the transaction is brief.
+            markups: list[str | None] = [None] * len(fresh)
+            if fetch is not None:
+                pending = {
+                    executor.submit(_fetch_embed, fetch, entry.link): i
+                    for i, entry in enumerate(fresh)
+                    if entry.link is not None
+                }
+                for future in futures.as_completed(pending):
+                    markups[pending[future]] = future.result()
+
+            for entry, markup in zip(fresh, markups, strict=True):
+                entry_id = db.add_entry(
+                    link=entry.link,
+                    title=entry.title,
+                    via=entry.via,
+                    note=entry.note,
+                    time_c=entry.time_c,
+                )
+                if markup:
+                    db.add_oembed(entry_id, markup)
+                    result.embeds += 1
+                result.added += 1
+            db.commit()
+            yield dataclasses.replace(result)
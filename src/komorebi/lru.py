@@ -0,0 +1,85 @@
+"""A thread-safe LRU bounded by the total size of the values it holds.
+
+Both the in-process tier of `tiered.TieredCache` and the memo of rendered
+markdown in `formatting` are kept in one. How big a value is is up to the
+caller, as what's cheap to measure differs between them.
+"""
+
+import collections
+import threading
+import time
+import typing as t
+
+__all__ = [
+    "LRU",
+]
+
+
+class LRU:
+    """A least recently used cache bounded by the total size of its values.
+
+    Args:
+        max_bytes: the most the values may add up to
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        # Each value, along with its expiry on the monotonic clock and size.
+        self._items: collections.OrderedDict[t.Hashable, tuple[float | None, int, t.Any]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: t.Hashable) -> tuple[bool, t.Any]:
+        """Get a value, and whether it was there at all."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return False, None
+            if item[0] is not None and item[0] <= time.monotonic():
+                self._discard(key)
+                return False, None
+            self._items.move_to_end(key)
+            return True, item[2]
+
+    def set(self, key: t.Hashable, value: t.Any, size: int, timeout: float | None = None) -> bool:
+        """Keep a value, evicting the least recently used to make room.
+
+        Args:
+            key: what to keep it under, replacing whatever's there
+            value: the value to keep
+            size: how much it counts towards `max_bytes`
+            timeout: how long to keep it for, in seconds, or `None` for as
+                long as there's room
+
+        Returns:
+            Whether it was kept, as anything over an eighth of `max_bytes`
+            would push out everything else.
+        """
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes // 8:
+                return False
+            expires = None if timeout is None else time.monotonic() + timeout
+            self._items[key] = (expires, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self._items)))
+                self.evictions += 1
+            return True
+
+    def delete(self, key: t.Hashable) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def _discard(self, key: t.Hashable) -> None:
+        if (item := self._items.pop(key, None)) is not None:
+            self.size -= item[1]
@@ -0,0 +1,242 @@
+"""A bounded pool of long-lived database connections."""
+
+import collections
+import dataclasses
+import logging
+import threading
+import time
+import typing as t
+
+logger = logging.getLogger(__name__)
+
+C = t.TypeVar("C")
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection became free within the pool's wait limit."""
+
+
+@dataclasses.dataclass
+class PoolStats:
+    """A snapshot of a pool's counters."""
+
+    size: int
+    idle: int
+    in_use: int
+    max_size: int
+    created: int
+    closed: int
+    checkouts: int
+    waits: int
+    timeouts: int
+    failed_pings: int
+    wait_time: float
+
+
+class ConnectionPool(t.Generic[C]):
+    """A thread-safe pool of connections.
+
+    `min_size` connections are opened up front, and more as they're needed.
+    They're handed out most-recently-used first so that surplus connections
+    sit idle long enough to be reaped, which happens whenever one is checked
+    out. The pool never holds more than `max_size` connections, and never
+    reaps below `min_size`; any discarded are replaced to make `min_size` up
+    again. Failing to open one then is only logged, as the next checkout
+    will try again.
+
+    Args:
+        connect: creates a new connection
+        close: closes a connection
+        ping: raises if the given connection is no longer usable
+        min_size: the number of connections kept open
+        max_size: the upper bound on open connections
+        idle_timeout: seconds an idle connection is kept beyond `min_size`
+        wait_timeout: seconds to wait for a connection when at `max_size`
+        ping_interval: seconds a connection may sit idle before it's checked
+    """
+
+    def __init__(
+        self,
+        connect: t.Callable[[], C],
+        *,
+        close: t.Callable[[C], None],
+        ping: t.Callable[[C], None] | None = None,
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout: float = 300.0,
+        wait_timeout: float = 10.0,
+        ping_interval: float = 30.0,
+    ) -> None:
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"bad pool bounds: min_size={min_size}, max_size={max_size}")
+        self._connect = connect
+        self._close = close
+        self._ping = ping
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        # Pairs of (connection, time it was returned to the pool)
+        self._idle: collections.deque[tuple[C, float]] = collections.deque()
+        self._size = 0
+        self._closed = False
+
+        self._created = 0
+        self._n_closed = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._failed_pings = 0
+        self._wait_time = 0.0
+
+        self._top_up()
+
+    def acquire(self) -> C:
+        """Check a connection out of the pool, opening one if needed."""
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            conn, last_used = self._checkout(deadline)
+            if conn is None:
+                return self._open()
+            if self._is_alive(conn, last_used):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn: C, *, discard: bool = False) -> None:
+        """Return a connection to the pool.
+
+        Args:
+            conn: a connection previously checked out with `acquire()`
+            discard: close the connection rather than reusing it
+        """
+        with self._cond:
+            if not discard and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+    def close(self) -> None:
+        """Close all idle connections and stop pooling returned ones."""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> PoolStats:
+        with self._cond:
+            return PoolStats(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                max_size=self.max_size,
+                created=self._created,
+                closed=self._n_closed,
+                checkouts=self._checkouts,
+                waits=self._waits,
+                timeouts=self._timeouts,
+                failed_pings=self._failed_pings,
+                wait_time=self._wait_time,
+            )
+
+    def _checkout(self, deadline: float) -> tuple[C | None, float]:
+        """Take an idle connection, or reserve a slot for a new one.
+
+        Returns `(None, 0)` when the caller should open a fresh connection.
+        """
+        reaped = []
+        started = None
+        try:
+            with self._cond:
+                while True:
+                    reaped.extend(self._reap())
+                    if self._idle:
+                        self._checkouts += 1
+                        return self._idle.pop()
+                    if self._size < self.max_size:
+                        self._size += 1
+                        self._checkouts += 1
+                        return None, 0.0
+                    now = time.monotonic()
+                    if started is None:
+                        started = now
+                        self._waits += 1
+                    if now >= deadline:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(f"no connection free after {self.wait_timeout}s")
+                    self._cond.wait(deadline - now)
+        finally:
+            if started is not None:
+                with self._cond:
+                    self._wait_time += time.monotonic() - started
+            for conn in reaped:
+                self._close_quietly(conn)
+
+    def _reap(self) -> list[C]:
+        """Remove connections idle for too long; must hold the lock."""
+        reaped = []
+        cutoff = time.monotonic() - self.idle_timeout
+        # The oldest connections are at the left of the queue.
+        while self._idle and self._size > self.min_size and self._idle[0][1] < cutoff:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._n_closed += 1
+            reaped.append(conn)
+        return reaped
+
+    def _open(self) -> C:
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _is_alive(self, conn: C, last_used: float) -> bool:
+        if self._ping is None or time.monotonic() - last_used < self.ping_interval:
+            return True
+        try:
+            self._ping(conn)
+        except Exception:
+            logger.warning("Discarding dead pooled connection", exc_info=True)
+            with self._cond:
+                self._failed_pings += 1
+            return False
+        return True
+
+    def _discard(self, conn: C) -> None:
+        with self._cond:
+            self._size -= 1
+            self._n_closed += 1
+            self._cond.notify()
+        self._close_quietly(conn)
+        self._top_up()
+
+    def _top_up(self) -> None:
+        """Open idle connections until there are `min_size` in all."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._open()
+            except Exception:
+                logger.warning("Could not open a pooled connection", exc_info=True)
+                return
+            self.release(conn)
+
+    def _close_quietly(self, conn: C) -> None:
+        try:
+            self._close(conn)
+        except Exception:
+            logger.debug("Error closing pooled connection", exc_info=True)
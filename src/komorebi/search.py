@@ -0,0 +1,104 @@
+"""Tokenizing entries and queries for the search index.
+
+The index maps each term to the entries it appears in, weighted by how often
+it appears and where: a term in a title counts for more than one in a note.
+"""
+
+import collections
+import re
+import typing as t
+from urllib import parse
+
+__all__ = [
+    "MAX_QUERY_TERMS",
+    "MAX_TERM_LENGTH",
+    "index_terms",
+    "query_terms",
+    "tokenize",
+]
+
+#: Longer terms are dropped rather than truncated; they're rarely words.
+MAX_TERM_LENGTH = 64
+#: Anything past this in a query is ignored.
+MAX_QUERY_TERMS = 8
+
+TITLE_WEIGHT = 3
+HOSTNAME_WEIGHT = 2
+NOTE_WEIGHT = 1
+
+# Words, keeping dotted and hyphenated runs together so that, e.g.,
+# "example.com" is a single term.
+RE_TERM = re.compile(r"\w+(?:[.\-']\w+)*")
+
+STOP_WORDS = frozenset(
+    [
+        "a",
+        "an",
+        "and",
+        "are",
+        "as",
+        "at",
+        "be",
+        "but",
+        "by",
+        "for",
+        "from",
+        "has",
+        "have",
+        "i",
+        "in",
+        "is",
+        "it",
+        "its",
+        "of",
+        "on",
+        "or",
+        "that",
+        "the",
+        "this",
+        "to",
+        "was",
+        "were",
+        "with",
+    ]
+)
+
+
+def tokenize(text: str | None) -> t.Iterator[str]:
+    """Split text into normalised search terms."""
+    if not text:
+        return
+    for match in RE_TERM.finditer(text.casefold()):
+        term = match.group().replace("'", "")
+        if len(term) <= MAX_TERM_LENGTH and term not in STOP_WORDS:
+            yield term
+
+
+def _hostname_terms(link: str | None) -> t.Iterator[str]:
+    if not link:
+        return
+    hostname = (parse.urlparse(link).hostname or "").removeprefix("www.")
+    if not hostname:
+        return
+    # The labels on their own too, bar the top-level domain. Like any other
+    # term, they have to fit in the index.
+    for term in (hostname, *hostname.split(".")[:-1]):
+        if len(term) <= MAX_TERM_LENGTH:
+            yield term
+
+
+def index_terms(title: str, link: str | None, note: str | None) -> dict[str, int]:
+    """Get the weight of each term in an entry."""
+    weights: collections.Counter[str] = collections.Counter()
+    for term in tokenize(title):
+        weights[term] += TITLE_WEIGHT
+    for term in set(_hostname_terms(link)):
+        weights[term] += HOSTNAME_WEIGHT
+    for term in tokenize(note):
+        weights[term] += NOTE_WEIGHT
+    return dict(weights)
+
+
+def query_terms(query: str) -> list[str]:
+    """Get the distinct terms to look up for a query, in order."""
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
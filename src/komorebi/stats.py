@@ -0,0 +1,94 @@
+"""Timing histograms for database statements."""
+
+import bisect
+import dataclasses
+import threading
+
+__all__ = [
+    "BUCKETS",
+    "Histogram",
+    "StatementStats",
+    "Timings",
+]
+
+#: Upper bounds, in seconds, of each histogram bucket. Anything slower than
+#: the last bound is counted in an overflow bucket.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+@dataclasses.dataclass
+class Histogram:
+    """Counts of durations falling into each of `BUCKETS`."""
+
+    counts: list[int] = dataclasses.field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+    total: float = 0.0
+    max: float = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, duration: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, duration)] += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], self.counts, strict=True)),
+        }
+
+
+@dataclasses.dataclass
+class StatementStats:
+    """How long a statement spent in the database and in converting rows.
+
+    The database time covers executing the statement and fetching its rows
+    from the driver; the conversion time covers building `Row`s from them.
+    """
+
+    database: Histogram = dataclasses.field(default_factory=Histogram)
+    conversion: Histogram = dataclasses.field(default_factory=Histogram)
+    rows: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "database": self.database.to_dict(),
+            "conversion": self.conversion.to_dict(),
+            "rows": self.rows,
+        }
+
+
+class Timings:
+    """A thread-safe registry of statement timings, keyed by statement name."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats: dict[str, StatementStats] = {}
+
+    def record(self, name: str, database: float, conversion: float = 0.0, rows: int = 0) -> None:
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = StatementStats()
+            stats.database.observe(database)
+            stats.conversion.observe(conversion)
+            stats.rows += rows
+
+    def snapshot(self) -> dict[str, StatementStats]:
+        with self._lock:
+            return {
+                name: StatementStats(
+                    database=dataclasses.replace(stats.database, counts=list(stats.database.counts)),
+                    conversion=dataclasses.replace(stats.conversion, counts=list(stats.conversion.counts)),
+                    rows=stats.rows,
+                )
+                for name, stats in self._stats.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,219 @@
+"""A cache backend keeping the most used values in memory in front of another.
+
+The shared backend, such as a filesystem or Redis cache, costs I/O and
+unpickling on every hit. Keeping the values hit most in a bounded LRU in each
+process avoids both for the handful of pages that get most of the traffic.
+
+Use it by setting `CACHE_TYPE` to `komorebi.tiered.TieredCache`, with the
+shared backend's type in `CACHE_SHARED_TYPE` and its settings as usual. A
+value is only kept in memory for `CACHE_LOCAL_TIMEOUT` seconds at most, as
+that bounds how long a change made by another process can go unseen. Values
+are stored in the shared backend along with when they expire, so that one
+read from it is kept in memory no longer than it's left to live there.
+Counters are left as they are, so that `inc` and `dec` work as the shared
+backend implements them, and are kept in memory for the full
+`CACHE_LOCAL_TIMEOUT`.
+
+Values are only pickled to find their size, and what's kept is handed out as
+is, so values mustn't be modified.
+"""
+
+import dataclasses
+import pickle
+import threading
+import time
+import typing as t
+
+from flask_caching.backends.base import BaseCache
+from werkzeug.utils import import_string
+
+from .lru import LRU
+
+__all__ = [
+    "TierStats",
+    "TieredCache",
+]
+
+
+@dataclasses.dataclass(frozen=True)
+class _Stored:
+    """A value as stored in the shared backend."""
+
+    value: t.Any
+    #: When it expires, by the wall clock, or `None` if it never does.
+    expires: float | None
+
+
+@dataclasses.dataclass
+class TierStats:
+    hits: int = 0
+    misses: int = 0
+
+
+class TieredCache(BaseCache):
+    """An in-process LRU in front of a shared cache backend.
+
+    Args:
+        shared: the backend shared between processes
+        default_timeout: the timeout used when none is given
+        max_bytes: the most the in-process tier holds, going by the pickled
+            size of its values
+        local_timeout: the longest a value is kept in-process, in seconds
+    """
+
+    def __init__(
+        self,
+        shared: BaseCache,
+        default_timeout: int = 300,
+        max_bytes: int = 16 * 1024 * 1024,
+        local_timeout: float = 5,
+    ) -> None:
+        super().__init__(default_timeout)
+        self.shared = shared
+        self.local_timeout = local_timeout
+        self._local = LRU(max_bytes)
+        self._stats_lock = threading.Lock()
+        self._local_stats = TierStats()
+        self._shared_stats = TierStats()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        name = config.get("CACHE_SHARED_TYPE", "SimpleCache")
+        if "." not in name:
+            name = f"flask_caching.backends.{name}"
+        shared = import_string(name).factory(app, config, args, dict(kwargs))
+        return cls(
+            shared,
+            default_timeout=kwargs.get("default_timeout", 300),
+            max_bytes=config.get("CACHE_LOCAL_MAX_BYTES", 16 * 1024 * 1024),
+            local_timeout=config.get("CACHE_LOCAL_TIMEOUT", 5),
+        )
+
+    def _local_expiry(self, timeout: int) -> float:
+        return self.local_timeout if timeout == 0 else min(timeout, self.local_timeout)
+
+    def _wrap(self, value: t.Any, timeout: int) -> _Stored:
+        return _Stored(value, None if timeout == 0 else time.time() + timeout)
+
+    def _unwrap(self, stored: t.Any) -> tuple[t.Any, float]:
+        """Get a value from the shared backend, and how long to keep it in memory."""
+        if not isinstance(stored, _Stored):
+            return stored, self.local_timeout
+        if stored.expires is None:
+            return stored.value, self.local_timeout
+        # The shared backend may only expire values to the second.
+        remaining = stored.expires - time.time()
+        return (stored.value, min(remaining, self.local_timeout)) if remaining > 0 else (None, 0)
+
+    def _keep(self, key: str, value: t.Any, timeout: float) -> None:
+        if value is None:
+            self._local.delete(key)
+        else:
+            self._local.set(key, value, len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), timeout)
+
+    def _count(self, local_hits: int, shared_hits: int, shared_misses: int) -> None:
+        with self._stats_lock:
+            self._local_stats.hits += local_hits
+            self._local_stats.misses += shared_hits + shared_misses
+            self._shared_stats.hits += shared_hits
+            self._shared_stats.misses += shared_misses
+
+    def get(self, key: str) -> t.Any:
+        found, value = self._local.get(key)
+        if found:
+            self._count(1, 0, 0)
+            return value
+        value, timeout = self._unwrap(self.shared.get(key))
+        if value is None:
+            self._count(0, 0, 1)
+        else:
+            self._count(0, 1, 0)
+            self._keep(key, value, timeout)
+        return value
+
+    def get_many(self, *keys: str) -> list[t.Any]:
+        values = []
+        missing = []
+        for i, key in enumerate(keys):
+            found, value = self._local.get(key)
+            values.append(value)
+            if not found:
+                missing.append(i)
+        shared_hits = 0
+        if missing:
+            fetched = self.shared.get_many(*(keys[i] for i in missing))
+            for i, stored in zip(missing, fetched, strict=True):
+                value, timeout = self._unwrap(stored)
+                if value is not None:
+                    values[i] = value
+                    self._keep(keys[i], value, timeout)
+                    shared_hits += 1
+        self._count(len(keys) - len(missing), shared_hits, len(missing) - shared_hits)
+        return values
+
+    def set(self, key: str, value: t.Any, timeout: int | None = None) -> bool | None:
+        timeout = self._normalize_timeout(timeout)
+        result = self.shared.set(key, self._wrap(value, timeout), timeout)
+        if result:
+            self._keep(key, value, self._local_expiry(timeout))
+        else:
+            self._local.delete(key)
+        return result
+
+    def set_many(self, mapping: dict[str, t.Any], timeout: int | None = None) -> list[t.Any]:
+        timeout = self._normalize_timeout(timeout)
+        stored = self.shared.set_many({key: self._wrap(value, timeout) for key, value in mapping.items()}, timeout)
+        succeeded = set(stored)
+        for key, value in mapping.items():
+            if key in succeeded:
+                self._keep(key, value, self._local_expiry(timeout))
+            else:
+                self._local.delete(key)
+        return stored
+
+    def add(self, key: str, value: t.Any, timeout: int | None = None) -> bool:
+        # Only the shared backend can say whether it's already there.
+        timeout = self._normalize_timeout(timeout)
+        added = self.shared.add(key, self._wrap(value, timeout), timeout)
+        if added:
+            self._keep(key, value, self._local_expiry(timeout))
+        return added
+
+    def delete(self, key: str) -> bool:
+        self._local.delete(key)
+        return self.shared.delete(key)
+
+    def delete_many(self, *keys: str) -> list[t.Any]:
+        for key in keys:
+            self._local.delete(key)
+        return self.shared.delete_many(*keys)
+
+    def has(self, key: str) -> bool:
+        # What's in memory may since have been deleted by another process.
+        return self.shared.has(key)
+
+    def clear(self) -> bool:
+        self._local.clear()
+        return self.shared.clear()
+
+    def inc(self, key: str, delta: int = 1) -> int | None:
+        self._local.delete(key)
+        return self.shared.inc(key, delta)
+
+    def dec(self, key: str, delta: int = 1) -> int | None:
+        self._local.delete(key)
+        return self.shared.dec(key, delta)
+
+    def stats(self) -> dict[str, t.Any]:
+        """Get the hit and miss counts of each tier, and the local tier's size."""
+        with self._stats_lock:
+            return {
+                "local": {
+                    **dataclasses.asdict(self._local_stats),
+                    "items": len(self._local),
+                    "bytes": self._local.size,
+                    "max_bytes": self._local.max_bytes,
+                    "evictions": self._local.evictions,
+                },
+                "shared": dataclasses.asdict(self._shared_stats),
+            }
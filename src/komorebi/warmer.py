@@ -0,0 +1,123 @@
+"""Rendering pages into the cache in the background.
+
+Without this, the first reader after a deploy or a change pays for rendering
+the pages they ask for. Instead, the pages most likely to be read are
+rendered into the cache by a background thread when the app starts, as are
+those affected by each change once it's committed.
+
+Pages are cached whatever host they're requested through, and have absolute
+URLs in them, so they can only be rendered in the background for the host
+readers use. Hence, warming needs `SERVER_NAME` configured.
+"""
+
+import datetime
+import functools
+import logging
+import threading
+import typing as t
+
+from flask import Flask
+
+from . import background, db
+
+__all__ = [
+    "HOT_TAGS",
+    "Warmer",
+    "base_url",
+    "init_app",
+    "paths_for",
+]
+
+logger = logging.getLogger(__name__)
+
+#: The endpoints of the pages depending on each cache tag, bar months.
+TAG_ENDPOINTS = {
+    "latest": ("blog.latest", "blog.feed"),
+    "archive": ("blog.archive",),
+    "sitemap": ("blog.sitemap",),
+}
+
+#: The tags of the pages warmed at startup, along with the current month.
+HOT_TAGS = ("latest", "archive", "sitemap")
+
+
+def paths_for(app: Flask, entry_ids: t.Iterable[int], tags: t.Iterable[str]) -> list[str]:
+    """Get the paths of the pages affected by changes to entries and tags."""
+    adapter = app.url_map.bind("localhost")
+    paths = []
+    for tag in sorted(tags):
+        if tag.startswith("month:"):
+            year, month = tag.removeprefix("month:").split("-")
+            paths.append(adapter.build("blog.month", {"year": year, "month": month}))
+        else:
+            paths.extend(adapter.build(endpoint, {}) for endpoint in TAG_ENDPOINTS.get(tag, ()))
+    paths.extend(adapter.build("blog.entry", {"entry_id": entry_id}) for entry_id in sorted(entry_ids))
+    return paths
+
+
+def base_url(app: Flask) -> str | None:
+    """Get the URL readers reach the app through, if `SERVER_NAME` is set."""
+    if not (server_name := app.config.get("SERVER_NAME")):
+        return None
+    root = app.config["APPLICATION_ROOT"].lstrip("/")
+    return f"{app.config['PREFERRED_URL_SCHEME']}://{server_name}/{root}"
+
+
+class Warmer:
+    """Requests pages in a background thread so that they get cached.
+
+    Pages already waiting to be requested aren't queued again.
+
+    Args:
+        app: the app to request pages from
+        base_url: the URL readers reach the app through
+    """
+
+    def __init__(self, app: Flask, base_url: str) -> None:
+        self.app = app
+        self.base_url = base_url
+        self._worker = background.Worker("komorebi-warmer")
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, paths: t.Iterable[str]) -> None:
+        with self._lock:
+            for path in paths:
+                if path not in self._pending:
+                    self._pending.add(path)
+                    self._worker.submit(functools.partial(self._warm, path))
+
+    def on_change(self, entry_ids: set[int], tags: set[str]) -> None:
+        self.schedule(paths_for(self.app, entry_ids, tags))
+
+    def join(self) -> None:
+        """Wait for everything scheduled so far to be requested."""
+        self._worker.join()
+
+    def _warm(self, path: str) -> None:
+        with self._lock:
+            self._pending.discard(path)
+        # Streamed pages are only cached once they've been read.
+        response = self.app.test_client().get(path, base_url=self.base_url, buffered=True)
+        if response.status_code >= 500:
+            logger.warning("Could not warm %s: got %s", path, response.status)
+
+
+def init_app(app: Flask) -> Warmer | None:
+    """Start warming the cache, unless `CACHE_WARM` is false.
+
+    The hot pages are scheduled straight away, and the pages affected by
+    each change after it's committed. Without `SERVER_NAME`, the cache isn't
+    warmed, as the pages would link to the wrong host.
+    """
+    if not app.config.get("CACHE_WARM", True):
+        return None
+    if (url := base_url(app)) is None:
+        logger.warning("Not warming the cache, as SERVER_NAME isn't configured")
+        return None
+    warmer = Warmer(app, url)
+    app.extensions["komorebi.warmer"] = warmer
+    db.on_change(app, warmer.on_change)
+    month = db.month_tag(datetime.datetime.now(datetime.UTC))
+    warmer.schedule(paths_for(app, (), (*HOT_TAGS, month)))
+    return warmer
@@ -0,0 +1,29 @@
+from pathlib import Path
+import sqlite3
+
+import pytest
+
+from komorebi.app import create_app
+
+SCHEMA = Path(__file__).parent.parent / "schema" / "schema.sqlite.sql"
+
+
+@pytest.fixture()
+def sqlite_app(tmp_path):
+    path = tmp_path / "komorebi.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SCHEMA.read_text())
+    conn.close()
+
+    app = create_app(testing=True)
+    app.config.update(
+        {
+            "DB_BACKEND": "sqlite",
+            "DB_DATABASE": str(path),
+            "FEED_ID": "tag:example.com,2005:komorebi",
+            "BLOG_AUTHOR": "Author",
+        }
+    )
+    yield app
+    if backend := app.extensions.get("komorebi.db"):
+        backend.close()
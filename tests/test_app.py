@@ -0,0 +1,37 @@
+import jinja2
+
+from komorebi import app as komorebi_app
+
+
+def test_template_bytecode_cache(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "templates"
+    settings = tmp_path / "settings.cfg"
+    settings.write_text(f"SECRET_KEY = 'test'\nCACHE_TYPE = 'NullCache'\nTEMPLATE_CACHE_DIR = {str(cache_dir)!r}\n")
+    monkeypatch.setenv("KOMOREBI_SETTINGS", str(settings))
+
+    app = komorebi_app.create_app()
+    assert isinstance(app.jinja_env.bytecode_cache, jinja2.FileSystemBytecodeCache)
+    names = komorebi_app.precompile_templates(app)
+    assert {"base.html", "macros.html", "latest.html"} <= set(names)
+    cached = {path.name: path.stat().st_mtime_ns for path in cache_dir.iterdir()}
+    assert len(cached) == len(names)
+
+    # Another instance loads them rather than compiling and storing them.
+    app = komorebi_app.create_app()
+    komorebi_app.precompile_templates(app)
+    assert {path.name: path.stat().st_mtime_ns for path in cache_dir.iterdir()} == cached
+
+
+def test_template_cache_dir_from_environment(tmp_path, monkeypatch):
+    settings = tmp_path / "settings.cfg"
+    settings.write_text("SECRET_KEY = 'test'\nCACHE_TYPE = 'NullCache'\n")
+    monkeypatch.setenv("KOMOREBI_SETTINGS", str(settings))
+    monkeypatch.setenv("KOMOREBI_TEMPLATE_CACHE_DIR", str(tmp_path / "templates"))
+    app = komorebi_app.create_app()
+    assert isinstance(app.jinja_env.bytecode_cache, jinja2.FileSystemBytecodeCache)
+
+    # Somewhere that can't be written to isn't fatal.
+    (tmp_path / "file").touch()
+    monkeypatch.setenv("KOMOREBI_TEMPLATE_CACHE_DIR", str(tmp_path / "file" / "templates"))
+    app = komorebi_app.create_app()
+    assert app.jinja_env.bytecode_cache is None
@@ -0,0 +1,15 @@
+import threading
+
+from komorebi import background
+
+
+def test_worker(caplog):
+    worker = background.Worker("komorebi-test")
+    done = []
+    worker.submit(lambda: done.append(threading.current_thread().name))
+    worker.submit(lambda: 1 / 0)
+    worker.submit(lambda: done.append("after"))
+    worker.join()
+    # Jobs run in order, in the worker's thread, despite one failing.
+    assert done == ["komorebi-test", "after"]
+    assert "ZeroDivisionError" in caplog.text
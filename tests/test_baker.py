@@ -0,0 +1,98 @@
+import datetime
+import gzip
+import json
+
+from komorebi import baker, compression, db, extensions
+
+
+def test_filename_for():
+    assert baker.filename_for("/", "text/html") == "index.html"
+    assert baker.filename_for("/archive", "text/html") == "archive.html"
+    assert baker.filename_for("/feed", "application/atom+xml") == "feed.atom"
+    assert baker.filename_for("/sitemap.xml", "application/xml") == "sitemap.xml"
+
+
+def test_bake(sqlite_app, tmp_path):
+    output = tmp_path / "site"
+    sqlite_app.config["SERVER_NAME"] = None
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+    with sqlite_app.app_context():
+        old = db.add_entry(
+            link=None,
+            title="Old",
+            via=None,
+            note="Padding " * 100,
+            time_c=datetime.datetime(2020, 1, 2, tzinfo=datetime.UTC),
+        )
+        new = db.add_entry(link=None, title="New", via=None, note=None)
+        db.commit()
+        month = db.month_tag(db.query_entry(new)["time_c"]).removeprefix("month:")  # type: ignore
+
+    # The live site's cached pages, rendered for another host, are ignored...
+    live = sqlite_app.test_client()
+    assert b"127.0.0.1" in live.get("/feed", base_url="http://127.0.0.1:8080/", buffered=True).data
+
+    runner = sqlite_app.test_cli_runner()
+    bake = ["komorebi", "bake", "--base-url", "https://blog.example.org/"]
+    result = runner.invoke(args=["komorebi", "bake", str(output)])
+    assert result.exit_code != 0
+    result = runner.invoke(args=[*bake, str(output)])
+    assert result.exit_code == 0, result.output
+    assert "Wrote 8 pages" in result.output
+    names = {path.name for path in output.iterdir()}
+    assert {"index.html", "archive.html", "feed.atom", "sitemap.xml", "2020-01.html", f"{month}.html"} <= names
+    assert {f"{old}.html", f"{new}.html", baker.MANIFEST} <= names
+    page = (output / "index.html").read_bytes()
+    assert b"Old" in page
+    assert gzip.decompress((output / "index.html.gz").read_bytes()) == page
+    if compression.brotli is not None:
+        assert compression.brotli.decompress((output / "index.html.br").read_bytes()) == page
+    assert json.loads((output / baker.MANIFEST).read_text())["modified"]
+    # Absolute URLs are for where the pages are to be served from.
+    for name in ["index.html", "feed.atom", "sitemap.xml"]:
+        data = (output / name).read_bytes()
+        assert b"https://blog.example.org/" in data, name
+        assert b"localhost" not in data
+        assert b"127.0.0.1" not in data
+    # ...and nothing rendered for the bake is cached for the live site.
+    with sqlite_app.app_context():
+        assert extensions.cache.get("view:/archive") is None
+
+    # Only pages touched by what's changed are rendered again.
+    with sqlite_app.app_context():
+        db.update_entry(old, link=None, title="Older", via=None, note=None)
+        db.commit()
+    result = runner.invoke(args=[*bake, str(output)])
+    assert result.exit_code == 0, result.output
+    assert b"Older" in (output / f"{old}.html").read_bytes()
+    assert b"Older" in (output / "2020-01.html").read_bytes()
+    assert b"Older" in (output / "index.html").read_bytes()
+    assert gzip.decompress((output / "index.html.gz").read_bytes()) == (output / "index.html").read_bytes()
+
+    result = runner.invoke(args=[*bake, "--full", str(output)])
+    assert "Wrote 0 pages; 8 were unchanged" in result.output
+
+    # Moving the site means rendering everything again.
+    result = runner.invoke(args=["komorebi", "bake", "--base-url", "https://example.net/", str(output)])
+    assert "Wrote 8 pages" in result.output
+
+
+def test_bake_base_url_must_match_server_name(sqlite_app, tmp_path):
+    runner = sqlite_app.test_cli_runner()
+    result = runner.invoke(args=["komorebi", "bake", "--base-url", "https://example.net/", str(tmp_path)])
+    assert result.exit_code != 0
+    assert "SERVER_NAME" in result.output
+
+
+def test_bake_in_workers(sqlite_app, tmp_path, monkeypatch):
+    settings = tmp_path / "settings.cfg"
+    names = ["SERVER_NAME", "APPLICATION_ROOT", "CACHE_TYPE", "DB_BACKEND", "DB_DATABASE", "FEED_ID", "BLOG_AUTHOR"]
+    settings.write_text("".join(f"{name} = {sqlite_app.config[name]!r}\n" for name in names))
+    monkeypatch.setenv("KOMOREBI_SETTINGS", str(settings))
+    with sqlite_app.app_context():
+        entry_ids = [db.add_entry(link=None, title=f"Entry {i}", via=None, note=None) for i in range(5)]
+        db.commit()
+        results = list(baker.bake(tmp_path / "site", base_url="http://example.com/site/", workers=2, chunk_size=3))
+    assert results[-1].written == 4 + 1 + len(entry_ids)
+    for entry_id in entry_ids:
+        assert (tmp_path / "site" / f"{entry_id}.html").exists()
@@ -1,4 +1,7 @@
-from komorebi import blog, db
+import datetime
+import gzip
+
+from komorebi import blog, db, extensions
 
 
 def test_process_archive_no_entries():
@@ -47,3 +50,90 @@ def test_process_archive_year_gap():
         {"year": 2021, "month": 1, "n": 0},
         {"year": 2021, "month": 2, "n": 1},
     ]
+
+
+def _add_entries(app, n: int) -> list[int]:
+    with app.app_context():
+        return [db.add_entry(link=None, title=f"Entry {i}", via=None, note=None) for i in range(n)]
+
+
+def test_latest_pages(sqlite_app, monkeypatch):
+    monkeypatch.setattr(db, "PAGE_SIZE", 2)
+    ids = _add_entries(sqlite_app, 5)
+    client = sqlite_app.test_client()
+
+    with sqlite_app.test_request_context():
+        first = list(db.query_latest(limit=5))
+    assert [entry["id"] for entry in first] == ids[::-1]
+
+    response = client.get("/")
+    assert response.status_code == 200
+    assert b"Entry 4" in response.data
+    assert b"Entry 2" not in response.data
+    assert b'rel="prev"' not in response.data
+    assert b'rel="next"' in response.data
+
+    older = db.PageKey.of(first[1])
+    response = client.get("/", query_string={"before": str(older)})
+    assert b"Entry 2" in response.data
+    assert b"Entry 1" in response.data
+    assert b"Entry 3" not in response.data
+    assert b'rel="prev"' in response.data
+
+    # Going back to the front page redirects rather than showing a short page.
+    response = client.get("/", query_string={"after": str(db.PageKey.of(first[2]))})
+    assert response.status_code == 302
+
+    response = client.get("/", query_string={"after": str(db.PageKey.of(first[4]))})
+    assert b"Entry 2" in response.data
+    assert b"Entry 1" in response.data
+
+
+def test_latest_bad_key(sqlite_app):
+    response = sqlite_app.test_client().get("/", query_string={"before": "junk"})
+    assert response.status_code == 400
+
+
+def test_page_key_round_trip():
+    key = db.PageKey(datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.UTC), 42)
+    assert db.PageKey.parse(str(key)) == key
+
+
+def test_stats_requires_login(sqlite_app):
+    response = sqlite_app.test_client().get("/stats")
+    assert response.status_code == 401
+
+
+def test_entry_cache(sqlite_app):
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+    client = sqlite_app.test_client()
+
+    # Missing entries are cached too.
+    assert client.get("/1").status_code == 404
+    with sqlite_app.app_context():
+        assert extensions.cache.get("db.entry:1") == "missing"
+        entry_id = db.add_entry(link=None, title="Original", via=None, note=None)
+    assert entry_id == 1
+
+    response = client.get("/1")
+    assert response.status_code == 200
+    assert b"Original" in response.data
+
+    with sqlite_app.app_context():
+        # Changed behind the cache's back, so the cached copy is served.
+        db.get_connection().execute("UPDATE links SET title = 'Sneaky'")
+    assert b"Original" in client.get("/1").data
+
+    with sqlite_app.app_context():
+        db.update_entry(entry_id, link=None, title="Updated", via=None, note=None)
+    assert b"Updated" in client.get("/1").data
+
+    with sqlite_app.app_context():
+        db.add_oembed(entry_id, "<p>Embedded</p>")
+    assert b"Embedded" in client.get("/1").data
+
+    # Served precompressed, as other cached pages are.
+    response = client.get("/1", headers={"Accept-Encoding": "gzip"})
+    assert response.content_encoding == "gzip"
+    assert "Accept-Encoding" in response.vary
+    assert b"Embedded" in gzip.decompress(response.data)
@@ -0,0 +1,285 @@
+import dataclasses
+import datetime
+import gzip
+import zlib
+
+import cachelib.simple
+import flask
+
+from komorebi import caching, compression, db, extensions
+
+
+def test_cached_view_invalidation():
+    app = flask.Flask(__name__)
+    extensions.cache.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+    calls = []
+
+    @app.route("/<name>")
+    @caching.cached(timeout=60, tags=lambda name: [f"name:{name}", "all"])
+    def view(name):
+        calls.append(name)
+        return f"{name} {len(calls)}"
+
+    @app.route("/missing")
+    @caching.cached(timeout=60, tags=["all"])
+    def missing():
+        calls.append("missing")
+        return flask.Response("nope", status=404)
+
+    client = app.test_client()
+    assert client.get("/a").text == "a 1"
+    assert client.get("/a").text == "a 1"
+    assert client.get("/b").text == "b 2"
+
+    with app.app_context():
+        caching.invalidate(["name:a"])
+    assert client.get("/a").text == "a 3"
+    assert client.get("/b").text == "b 2"
+
+    with app.app_context():
+        caching.invalidate(["all"])
+    assert client.get("/b").text == "b 4"
+
+    # Failures aren't cached.
+    client.get("/missing")
+    client.get("/missing")
+    assert calls.count("missing") == 2
+
+
+def test_tag_versions_never_expire(monkeypatch):
+    app = flask.Flask(__name__)
+    extensions.cache.init_app(app, config={"CACHE_TYPE": "SimpleCache", "CACHE_DEFAULT_TIMEOUT": 300})
+    now = 1_000_000.0
+    monkeypatch.setattr(cachelib.simple, "time", lambda: now)
+    with app.app_context():
+        created = caching.tag_versions(["created"])
+        caching.invalidate(["invalidated"])
+        invalidated = caching.tag_versions(["invalidated"])
+        now += 3600
+        assert caching.tag_versions(["created"]) == created
+        assert caching.tag_versions(["invalidated"]) == invalidated
+
+
+def test_writes_invalidate_views(sqlite_app):
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+    with sqlite_app.app_context():
+        entry_id = db.add_entry(link=None, title="Original", via=None, note=None)
+        entry = db.query_entry(entry_id)
+    assert entry is not None
+    month = entry["time_c"].strftime("/%Y-%m")
+
+    client = sqlite_app.test_client()
+    paths = ["/", "/feed", month]
+    for path in paths:
+        assert b"Original" in client.get(path).data
+    compressed = client.get("/feed", headers={"Accept-Encoding": "gzip"})
+    assert b"Original" in gzip.decompress(compressed.data)
+
+    with sqlite_app.app_context():
+        db.update_entry(entry_id, link=None, title="Updated", via=None, note=None)
+    for path in paths:
+        assert b"Updated" in client.get(path).data, path
+    # Nor are stale compressed copies served.
+    compressed = client.get("/feed", headers={"Accept-Encoding": "gzip"})
+    assert b"Updated" in gzip.decompress(compressed.data)
+
+    archive = client.get("/archive").data
+    with sqlite_app.app_context():
+        db.add_entry(link=None, title="Another", via=None, note=None)
+    assert client.get("/archive").data != archive
+
+
+def test_conditional_requests(sqlite_app):
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+    with sqlite_app.app_context():
+        entry_id = db.add_entry(link=None, title="Original", via=None, note=None)
+
+    client = sqlite_app.test_client()
+    for path in ["/", "/archive", "/feed", "/sitemap.xml", f"/{entry_id}"]:
+        # Streamed pages are only cached once they've been read.
+        response = client.get(path, headers={"Accept-Encoding": "gzip"}, buffered=True)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        modified = response.headers["Last-Modified"]
+
+        # Compressed or not, the ETag is recognised.
+        response = client.get(path, headers={"If-None-Match": etag})
+        assert response.status_code == 304, path
+        assert response.data == b""
+        assert client.get(path, headers={"If-Modified-Since": modified}).status_code == 304
+        # If-None-Match takes precedence.
+        response = client.get(
+            path,
+            headers={"If-None-Match": '"other"', "If-Modified-Since": modified},
+            buffered=True,
+        )
+        assert response.status_code == 200
+
+    etag = client.get("/", buffered=True).headers["ETag"]
+    with sqlite_app.app_context():
+        db.update_entry(entry_id, link=None, title="Updated", via=None, note=None)
+    response = client.get("/", headers={"If-None-Match": etag}, buffered=True)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_conditional_requests_for_failures(sqlite_app):
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+    with sqlite_app.app_context():
+        db.add_entry(link=None, title="Exists", via=None, note=None)
+
+    client = sqlite_app.test_client()
+    future = {"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+    # Only what's been rendered successfully and cached gets a 304.
+    assert client.get("/", headers=future, buffered=True).status_code == 200
+    caching._deferred.join()
+    assert client.get("/", headers=future, buffered=True).status_code == 304
+    assert client.get("/999", headers=future).status_code == 404
+    assert client.get("/1999-01", headers=future).status_code == 404
+    assert client.get("/?before=junk", headers=future).status_code == 400
+
+
+def test_precompressed_variants(sqlite_app, monkeypatch):
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+    encoded = []
+    encoders = {
+        name: lambda data, name=name, encoder=encoder: encoded.append(name) or encoder(data)
+        for name, encoder in compression._ENCODERS.items()
+    }
+    monkeypatch.setattr(compression, "_ENCODERS", encoders)
+    with sqlite_app.app_context():
+        db.add_entry(link=None, title="Compressed", via=None, note="Squeeze me " * 100)
+
+    client = sqlite_app.test_client()
+    decoders = {"gzip": gzip.decompress, "deflate": zlib.decompress}
+    if compression.brotli is not None:
+        decoders["br"] = compression.brotli.decompress
+    etags = set()
+    for accept, expected in [
+        ("gzip, deflate, br", "br" if "br" in decoders else "gzip"),
+        ("gzip", "gzip"),
+        ("deflate;q=0.5, gzip;q=0.1", "deflate"),
+        ("", None),
+    ]:
+        response = client.get("/", headers={"Accept-Encoding": accept})
+        assert response.status_code == 200
+        assert response.content_encoding == expected
+        assert "Accept-Encoding" in response.vary
+        body = decoders[expected](response.data) if expected else response.data
+        assert b"Squeeze me" in body
+        etags.add(response.headers["ETag"])
+
+        response = client.get("/", headers={"Accept-Encoding": accept, "If-None-Match": response.headers["ETag"]})
+        assert response.status_code == 304
+    # A strong ETag per variant, but each compressed only once.
+    assert len(etags) == len(decoders) + 1
+    assert sorted(encoded) == sorted(decoders)
+
+
+def test_streamed_responses(sqlite_app):
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+    with sqlite_app.app_context():
+        for i in range(30):
+            db.add_entry(
+                link=None,
+                title=f"Entry {i}",
+                via=None,
+                note="Padding " * 50,
+                time_c=datetime.datetime(2020, 1, 2, tzinfo=datetime.UTC),
+            )
+        db.commit()
+
+    client = sqlite_app.test_client()
+    # Generated and compressed as it's sent...
+    response = client.get("/2020-01", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Length" not in response.headers
+    assert response.content_encoding == "gzip"
+    assert response.headers["ETag"].endswith(':gzip"')
+    body = gzip.decompress(response.data)
+    assert all(f"Entry {i}<".encode() in body for i in range(30))
+    with sqlite_app.app_context():
+        # It's only cached, and the lock released, in the background.
+        caching._deferred.join()
+        assert extensions.cache.get("lock:view:/2020-01") is None
+
+    # ...and cached once it's all been sent.
+    response = client.get("/2020-01", headers={"Accept-Encoding": "deflate"})
+    assert "Content-Length" in response.headers
+    assert response.content_encoding == "deflate"
+    assert zlib.decompress(response.data) == body
+
+
+def test_big_streamed_responses_are_spooled(sqlite_app, monkeypatch):
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+    monkeypatch.setattr(caching, "STREAM_SPOOL_MAX_BYTES", 1000)
+    with sqlite_app.app_context():
+        db.add_entry(link=None, title="Big", via=None, note="Padding " * 500)
+        db.commit()
+
+    client = sqlite_app.test_client()
+    body = client.get("/").data
+    assert len(body) > 1000
+    caching._deferred.join()
+    with sqlite_app.app_context():
+        assert extensions.cache.get("blog.latest").bodies["identity"] == body
+        assert extensions.cache.get("lock:blog.latest") is None
+
+
+def test_encode_stream():
+    chunks = [bytes([ord("a") + i]) * 3000 for i in range(3)]
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    encoded = list(compression.encode_stream(iter(chunks), "gzip"))
+    # Small chunks are gathered up, and each is decodable as it arrives.
+    assert len(encoded) == 2
+    assert decompressor.decompress(encoded[0]) == chunks[0] + chunks[1]
+    assert decompressor.decompress(encoded[1]) == chunks[2]
+    assert decompressor.eof
+    assert list(compression.encode_stream(iter(chunks), compression.IDENTITY)) == [chunks[0] + chunks[1], chunks[2]]
+
+
+def test_single_flight(monkeypatch):
+    monkeypatch.setattr(caching, "WAIT_TIMEOUT", 0.1)
+    app = flask.Flask(__name__)
+    extensions.cache.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+    calls = []
+
+    @app.route("/<name>")
+    @caching.cached(timeout=60, tags=["all"])
+    def view(name):
+        calls.append(name)
+        return f"{name} {len(calls)}"
+
+    client = app.test_client()
+    assert client.get("/a").text == "a 1"
+    etag = client.get("/a").headers["ETag"]
+    with app.app_context():
+        caching.invalidate(["all"])
+        # As if another request were regenerating them.
+        extensions.cache.add("lock:view:/a", 1)
+        extensions.cache.add("lock:view:/b", 1)
+
+    # The stale copy is served meanwhile, with its own validators.
+    response = client.get("/a")
+    assert response.text == "a 1"
+    assert response.headers["ETag"] == etag
+    assert response.last_modified is None
+    # Without one, it's regenerated once waiting for it is fruitless.
+    assert client.get("/b").text == "b 2"
+
+    with app.app_context():
+        extensions.cache.delete("lock:view:/a")
+    assert client.get("/a").text == "a 3"
+    assert client.get("/a").headers["ETag"] != etag
+
+
+def test_early_refresh(monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(caching.time, "time", lambda: now)
+    record = caching._Variants({"all": "1"}, [], {}, expires=now + 60, delta=10)
+    assert not record.is_fresh({"all": "2"})
+    # The longer generating it took, the likelier it's refreshed early.
+    monkeypatch.setattr(caching.random, "random", lambda: 0.5)
+    assert record.is_fresh({"all": "1"})
+    monkeypatch.setattr(caching.random, "random", lambda: 0.999)
+    assert not record.is_fresh({"all": "1"})
+    assert dataclasses.replace(record, delta=0.1).is_fresh({"all": "1"})
@@ -0,0 +1,254 @@
+import datetime
+import pickle
+import sqlite3
+
+import flask
+import pytest
+
+from komorebi import backends, db, extensions, formatting
+
+
+def test_statement_fallback():
+    stmt = db.Statement(firebird="firebird", sqlite="sqlite")
+    assert stmt.text("sqlite") == "sqlite"
+    assert db.Statement(firebird="firebird").text("sqlite") == "firebird"
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        backends.create_backend({"DB_BACKEND": "nonesuch"})
+
+
+def test_sqlite_round_trip(sqlite_app):
+    with sqlite_app.app_context():
+        entry_id = db.add_entry(link="https://example.com/", title="Title", via=" ", note="Note")
+        db.add_oembed(entry_id, "<p>Embed</p>")
+
+    with sqlite_app.app_context():
+        assert db.pool_stats() is None
+        entry = db.query_entry(entry_id)
+        assert entry is not None
+        assert entry["title"] == "Title"
+        assert entry["via"] is None
+        assert entry["html"] == "<p>Embed</p>"
+        assert entry["time_c"].tzinfo == datetime.UTC
+
+        assert [row["id"] for row in db.query_latest()] == [entry_id]
+        # Bumped in memory by the write rather than read back.
+        modified = db.query_last_modified()
+        assert modified is not None
+        assert modified >= entry["time_m"]
+
+        now = entry["time_c"]
+        assert [dict(month) for month in db.query_archive()] == [{"year": now.year, "month": now.month, "n": 1}]
+        assert [row["id"] for row in db.query_month(now.year, now.month)] == [entry_id]
+
+
+def test_sqlite_integrity_error(sqlite_app):
+    with sqlite_app.app_context():
+        db.add_entry(link="https://example.com/", title="Title", via=None, note=None)
+        with pytest.raises(db.IntegrityError):
+            db.add_entry(link="https://example.com/", title="Again", via=None, note=None)
+
+
+def test_sqlite_update(sqlite_app):
+    with sqlite_app.app_context():
+        entry_id = db.add_entry(link=None, title="Title", via=None, note=None)
+        db.update_entry(entry_id, link=None, title="Changed", via=None, note="Note")
+        entry = db.query_entry(entry_id)
+        assert entry is not None
+        assert entry["title"] == "Changed"
+        assert entry["note"] == "Note"
+
+
+def test_statement_cache():
+    stats = backends.PrepareStats()
+    dropped = []
+
+    def record(hit: bool) -> None:  # noqa: FBT001
+        if hit:
+            stats.hits += 1
+        else:
+            stats.misses += 1
+
+    cache = backends.StatementCache(2, record=record, drop=dropped.append)
+    assert cache.checkout("a") is None
+    cache.checkin("a", "stmt-a")
+    assert cache.checkout("a") == "stmt-a"
+    # Nested use of the same SQL gets its own statement...
+    assert cache.checkout("a") is None
+    cache.checkin("a", "stmt-a")
+    # ...which gets dropped when it comes back.
+    cache.checkin("a", "stmt-a2")
+    assert dropped == ["stmt-a2"]
+
+    cache.checkin("b", "stmt-b")
+    cache.checkin("c", "stmt-c")
+    assert dropped == ["stmt-a2", "stmt-a"]
+    assert len(cache) == 2
+    assert stats == backends.PrepareStats(hits=1, misses=2)
+
+
+def test_sqlite_prepare_stats(sqlite_app):
+    with sqlite_app.app_context():
+        db.query_entry(1)
+        before = db.prepare_stats()
+        db.query_entry(1)
+        after = db.prepare_stats()
+    assert after.hits == before.hits + 1
+    assert after.misses == before.misses
+
+
+def test_replica_routing(sqlite_app):
+    sqlite_app.config["DB_REPLICA_DATABASE"] = sqlite_app.config["DB_DATABASE"]
+
+    with sqlite_app.test_request_context("/", method="GET"):
+        conn = db.get_read_connection()
+        assert conn is not db.get_connection()
+        # The replica connection refuses writes.
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM links")
+        assert db.pool_stats(replica=True) is None
+
+    with sqlite_app.test_request_context("/add", method="POST"):
+        assert db.get_read_connection() is db.get_connection()
+        db.add_entry(link=None, title="Title", via=None, note=None)
+
+    # Just after a write, reads go to the primary.
+    with sqlite_app.test_request_context("/", method="GET"):
+        assert db.get_read_connection() is db.get_connection()
+
+
+def test_replica_misses_not_cached(sqlite_app):
+    sqlite_app.config["DB_REPLICA_DATABASE"] = sqlite_app.config["DB_DATABASE"]
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+
+    # The replica may just not have caught up...
+    with sqlite_app.test_request_context("/999", method="GET"):
+        assert db.query_entry(999) is None
+        assert extensions.cache.get("db.entry:999") is None
+    # ...but the primary is to be believed.
+    with sqlite_app.app_context():
+        assert db.query_entry(999) is None
+        assert extensions.cache.get("db.entry:999") is not None
+
+
+def test_archive_rebuild(sqlite_app):
+    with sqlite_app.app_context():
+        db.add_entry(link=None, title="Title", via=None, note=None)
+        db.get_connection().execute("UPDATE archive_months SET n = 42")
+        expected = [{**month, "n": 1} for month in db.query_archive()]
+
+    result = sqlite_app.test_cli_runner().invoke(args=["komorebi", "rebuild-archive"])
+    assert result.exit_code == 0
+
+    with sqlite_app.app_context():
+        assert [dict(month) for month in db.query_archive()] == expected
+
+
+def test_note_rendered_on_write(sqlite_app):
+    with sqlite_app.app_context():
+        entry_id = db.add_entry(link=None, title="Title", via=None, note="*Hi*")
+        entry = db.query_entry(entry_id)
+        assert entry is not None
+        assert entry["note_html"] == "<p><em>Hi</em></p>"
+        assert entry["note_version"] == formatting.RENDERER_VERSION
+        db.update_entry(entry_id, link=None, title="Title", via=None, note="")
+        entry = db.query_entry(entry_id)
+        assert entry is not None
+        assert entry["note_html"] is None
+        assert formatting.render_note(entry) == ""
+
+
+def test_rerender(sqlite_app):
+    with sqlite_app.app_context():
+        entry_ids = [db.add_entry(link=None, title=f"Title {i}", via=None, note=f"Note {i}") for i in range(3)]
+        db.get_connection().execute("UPDATE links SET note_html = 'stale', note_version = 0")
+        entry = db.query_entry(entry_ids[0])
+        assert entry is not None
+        # Stale HTML is ignored until the note's re-rendered.
+        assert formatting.render_note(entry) == "<p>Note 0</p>"
+
+    result = sqlite_app.test_cli_runner().invoke(args=["komorebi", "rerender", "--batch-size", "2"])
+    assert result.exit_code == 0
+    assert "Re-rendered 3 notes" in result.output
+
+    with sqlite_app.app_context():
+        for i, entry_id in enumerate(entry_ids):
+            entry = db.query_entry(entry_id)
+            assert entry is not None
+            assert entry["note_html"] == f"<p>Note {i}</p>"
+            assert entry["note_version"] == formatting.RENDERER_VERSION
+
+
+def test_statement_name():
+    assert db.statement_name(db.ENTRY) == "entry"
+    assert db.statement_name("SELECT  1\nFROM x") == db.statement_name("SELECT 1 FROM x")
+    assert db.statement_name("SELECT 1 FROM x").startswith("select-")
+    assert db.statement_name(db.Statement(firebird="DELETE FROM x")).startswith("delete-")
+
+
+def test_query_timings(sqlite_app, caplog):
+    sqlite_app.config["DB_SLOW_QUERY_THRESHOLD"] = 0
+    with sqlite_app.app_context():
+        entry_id = db.add_entry(link=None, title="Title", via=None, note=None)
+        db.query_entry(entry_id)
+        list(db.query_sitemap())
+        timings = db.query_stats()
+    assert timings["entry"].database.count == 1
+    assert timings["entry"].rows == 1
+    assert timings["sitemap"].conversion.count == 1
+    assert timings["sitemap"].rows == 1
+    assert timings["adjust-archive"].rows == 0
+    assert any("Slow query entry" in message and repr((entry_id,)) in message for message in caplog.messages)
+
+
+def test_row():
+    row = db._make_row(("id", "title"), (1, "Title"))
+    assert row == (1, "Title")
+    assert row["title"] == row.title == row[1] == "Title"
+    assert row.get("link") is None
+    assert dict(row) == {"id": 1, "title": "Title"}
+    assert pickle.loads(pickle.dumps(row)).title == "Title"  # noqa: S301
+    with pytest.raises(AttributeError):
+        row.link  # noqa: B018
+
+
+def test_query_batches(sqlite_app):
+    with sqlite_app.app_context():
+        for i in range(5):
+            db.add_entry(link=None, title=f"Entry {i}", via=None, note=None)
+        titles = [row.title for row in db.query("SELECT title FROM links ORDER BY id", batch_size=2)]
+    assert titles == [f"Entry {i}" for i in range(5)]
+
+
+def test_query_all_releases(sqlite_app):
+    with sqlite_app.test_request_context("/", method="GET"):
+        db.query_latest()
+        assert "db" not in flask.g
+    with sqlite_app.test_request_context("/add", method="POST"):
+        db.add_entry(link=None, title="Title", via=None, note=None)
+        db.query_latest()
+        assert "db" in flask.g
+
+
+def test_last_modified_tracking(sqlite_app):
+    with sqlite_app.app_context():
+        assert db.query_last_modified() is None
+        db.add_entry(link=None, title="Title", via=None, note=None)
+        # Not bumped until the change is committed.
+        assert db.query_last_modified() is None
+        db.commit()
+        bumped = db.query_last_modified()
+        assert bumped is not None
+        assert bumped.microsecond == 0
+        assert db.query_stats()["last-modified"].database.count == 1
+
+        # Once stale, it's read from the database again.
+        sqlite_app.extensions["komorebi.db"].last_modified_ttl = 0
+        db.add_entry(link=None, title="Title", via=None, note=None)
+        db.commit()
+        modified = db.query_last_modified()
+        assert modified is not None
+        assert modified <= bumped
+        assert db.query_stats()["last-modified"].database.count == 2
@@ -0,0 +1,55 @@
+import io
+import json
+from xml.etree import ElementTree as ET
+
+from komorebi import db, exporter, importer
+
+
+def test_export_jsonl(sqlite_app, tmp_path):
+    with sqlite_app.app_context():
+        first = db.add_entry(link="https://example.com/", title="First", via=None, note="*Note*")
+        db.add_oembed(first, "<p>Embed</p>")
+        db.add_entry(link=None, title="Second", via="https://example.net/", note=None)
+
+    path = tmp_path / "export.jsonl"
+    result = sqlite_app.test_cli_runner().invoke(args=["komorebi", "export", "--batch-size", "1", str(path)])
+    assert result.exit_code == 0, result.output
+    docs = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [doc["title"] for doc in docs] == ["First", "Second"]
+    assert docs[0]["html"] == "<p>Embed</p>"
+    assert docs[0]["note"] == "*Note*"
+    assert docs[1]["via"] == "https://example.net/"
+
+    # What's exported can be imported again.
+    with path.open("rb") as fh:
+        entries = list(importer.read_jsonl(fh))
+    assert [entry.title for entry in entries] == ["First", "Second"]
+    assert entries[0].time_c is not None
+
+
+def test_export_atom(sqlite_app):
+    with sqlite_app.app_context():
+        db.add_entry(link="https://example.com/", title="First", via=None, note=None)
+
+    result = sqlite_app.test_cli_runner().invoke(args=["komorebi", "export", "--format", "atom"])
+    assert result.exit_code == 0, result.output
+    feed = ET.fromstring(result.stdout)  # noqa: S314
+    titles = [elem.text for elem in feed.iter("{http://www.w3.org/2005/Atom}title")]
+    assert titles == ["My Weblog", "First"]
+
+
+def test_snapshot(sqlite_app):
+    with sqlite_app.app_context():
+        db.add_entry(link=None, title="Before", via=None, note=None)
+        db.commit()
+        out = io.StringIO()
+        with db.snapshot():
+            entries = db.query_export(batch_size=1)
+            first = next(entries)
+            # Written on the request's own connection, so the snapshot
+            # doesn't see it.
+            db.add_entry(link=None, title="After", via=None, note=None)
+            db.commit()
+            assert exporter.write_jsonl(out, entries) == 0
+        assert first["title"] == "Before"
+        assert [entry["title"] for entry in db.query_export()] == ["Before", "After"]
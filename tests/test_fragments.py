@@ -0,0 +1,45 @@
+import flask
+
+from komorebi import db, extensions, fragments
+
+
+def test_fragments_shared_between_pages(sqlite_app, monkeypatch):
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+    rendered = []
+
+    def get_template_attribute(template, name):
+        macro = flask.get_template_attribute(template, name)
+        return lambda entry: rendered.append(entry["id"]) or macro(entry)
+
+    monkeypatch.setattr(fragments, "get_template_attribute", get_template_attribute)
+    with sqlite_app.app_context():
+        first = db.add_entry(link="https://example.com/", title="First", via=None, note="*Note*")
+        second = db.add_entry(link=None, title="Second", via=None, note=None)
+        db.commit()
+        month = db.month_tag(db.query_entry(first)["time_c"]).removeprefix("month:")  # type: ignore
+
+    client = sqlite_app.test_client()
+    page = client.get("/").text
+    assert sorted(rendered) == [first, second]
+    assert page.count("<article>") == 2
+    assert client.get(f"/{month}").text.count("<article>") == 2
+    assert "First" in client.get(f"/{first}").text
+    assert sorted(rendered) == [first, second]
+
+    # Only the changed entry is rendered again.
+    with sqlite_app.app_context():
+        db.update_entry(second, link=None, title="Second, edited", via=None, note=None)
+        db.commit()
+    assert "Second, edited" in client.get("/").text
+    assert sorted(rendered) == [first, second, second]
+
+    # Nor are fragments rendered under one root URL used under another.
+    page = client.get(f"/{month}", base_url="https://blog.example.org/blog/").text
+    assert "/site/" not in page
+    assert sorted(rendered) == sorted([first, second, second, first, second])
+
+
+def test_digest():
+    entry = {"id": 1, "title": "Title", "note": None}
+    assert fragments.digest(entry) == fragments.digest(dict(reversed(entry.items())))
+    assert fragments.digest(entry) != fragments.digest({**entry, "note": "Note"})
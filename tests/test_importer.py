@@ -0,0 +1,136 @@
+import datetime
+import io
+import json
+
+from komorebi import db, importer
+
+ATOM = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>Feed</title>
+  <entry>
+    <title>First</title>
+    <link rel="alternate" type="text/html" href="https://example.com/1"/>
+    <link rel="via" type="text/html" href="https://example.net/"/>
+    <published>2020-01-02T03:04:05Z</published>
+    <content type="html">A note</content>
+  </entry>
+  <entry>
+    <title>Second</title>
+    <link href="https://example.com/2"/>
+    <updated>2020-02-02T00:00:00+00:00</updated>
+  </entry>
+</feed>
+"""
+
+BOOKMARKS = b"""<!DOCTYPE NETSCAPE-Bookmark-file-1>
+<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">
+<TITLE>Bookmarks</TITLE>
+<H1>Bookmarks</H1>
+<DL><p>
+    <DT><H3>Folder</H3>
+    <DL><p>
+        <DT><A HREF="https://example.com/1" ADD_DATE="1577934245">First</A>
+        <DD>A note
+        <DT><A HREF="https://example.com/2">Second</A>
+    </DL><p>
+    <DT><A HREF="https://example.com/3"></A>
+</DL><p>
+"""
+
+
+def test_read_jsonl():
+    lines = [
+        {"title": "First", "link": "https://example.com/1", "time_c": "2020-01-02T03:04:05"},
+        {"title": "", "link": None},
+        {"link": "https://example.com/2", "note": "A note"},
+    ]
+    fh = io.BytesIO("\n".join(map(json.dumps, lines)).encode())
+    entries = list(importer.read_jsonl(fh))
+    assert entries[0] == importer.ImportedEntry(
+        title="First",
+        link="https://example.com/1",
+        time_c=datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.UTC),
+    )
+    assert entries[1] is None
+    assert entries[2] == importer.ImportedEntry(
+        title="https://example.com/2", link="https://example.com/2", note="A note"
+    )
+
+
+def test_read_atom():
+    entries = list(importer.read_atom(io.BytesIO(ATOM)))
+    assert entries == [
+        importer.ImportedEntry(
+            title="First",
+            link="https://example.com/1",
+            via="https://example.net/",
+            note="A note",
+            time_c=datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.UTC),
+        ),
+        importer.ImportedEntry(
+            title="Second",
+            link="https://example.com/2",
+            time_c=datetime.datetime(2020, 2, 2, tzinfo=datetime.UTC),
+        ),
+    ]
+
+
+def test_read_netscape():
+    entries = list(importer.read_netscape(io.BytesIO(BOOKMARKS)))
+    assert entries == [
+        importer.ImportedEntry(
+            title="First",
+            link="https://example.com/1",
+            note="A note",
+            time_c=datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.UTC),
+        ),
+        importer.ImportedEntry(title="Second", link="https://example.com/2"),
+        importer.ImportedEntry(title="https://example.com/3", link="https://example.com/3"),
+    ]
+
+
+def test_guess_format():
+    assert importer.guess_format("bookmarks.HTML") == "netscape"
+    assert importer.guess_format("feed.xml") == "atom"
+    assert importer.guess_format("entries.jsonl") == "jsonl"
+    assert importer.guess_format("entries.csv") is None
+
+
+def test_import_entries(sqlite_app):
+    with sqlite_app.app_context():
+        db.add_entry(link="https://example.com/1", title="Existing", via=None, note=None)
+        db.commit()
+
+    entries = [
+        importer.ImportedEntry(title="One", link="https://example.com/1"),
+        importer.ImportedEntry(title="Two", link="https://example.com/2"),
+        importer.ImportedEntry(title="Two again", link="https://example.com/2"),
+        None,
+        importer.ImportedEntry(
+            title="Three",
+            note="No link",
+            time_c=datetime.datetime(2020, 1, 2, tzinfo=datetime.UTC),
+        ),
+    ]
+    with sqlite_app.app_context():
+        results = list(
+            importer.import_entries(entries, batch_size=2, fetch=lambda url: f"<p>{url}</p>" if "2" in url else None)
+        )
+        assert len(results) == 2
+        assert results[-1] == importer.ImportStats(added=2, duplicates=2, skipped=1, embeds=1)
+        archive = {(month["year"], month["month"]): month["n"] for month in db.query_archive()}
+        assert archive[2020, 1] == 1
+        latest = {entry["title"]: entry for entry in db.query_latest()}
+        assert set(latest) == {"Existing", "Two", "Three"}
+        assert latest["Two"]["html"] == "<p>https://example.com/2</p>"
+        assert latest["Three"]["time_c"] == datetime.datetime(2020, 1, 2, tzinfo=datetime.UTC)
+
+
+def test_import_command(sqlite_app, tmp_path):
+    path = tmp_path / "entries.jsonl"
+    path.write_text(json.dumps({"title": "Imported", "link": "https://example.com/"}) + "\n")
+    result = sqlite_app.test_cli_runner().invoke(args=["komorebi", "import", "--no-embeds", str(path)])
+    assert result.exit_code == 0, result.output
+    assert "Added 1 entries" in result.output
+    with sqlite_app.app_context():
+        assert db.existing_links(["https://example.com/", "https://example.org/"]) == {"https://example.com/"}
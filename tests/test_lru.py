@@ -0,0 +1,25 @@
+from komorebi import lru
+
+
+def test_lru(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(lru.time, "monotonic", lambda: now)
+    items = lru.LRU(max_bytes=80)
+    assert items.set("a", "one", 10)
+    assert items.set("b", "two", 10, timeout=5)
+    assert items.get("a") == (True, "one")
+    assert (len(items), items.size) == (2, 20)
+
+    now += 5
+    assert items.get("b") == (False, None)
+    assert items.size == 10
+
+    # Anything over an eighth of the budget isn't kept.
+    assert not items.set("a", "big", 11)
+    assert items.get("a") == (False, None)
+
+    for i in range(9):
+        items.set(i, i, 10)
+    assert items.size == 80
+    assert items.evictions == 1
+    assert items.get(0) == (False, None)
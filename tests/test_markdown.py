@@ -8,3 +8,27 @@ def test_empty():
 
 def test_basic_rendering():
     assert formatting.render_markdown("foo") == "<p>foo</p>"
+
+
+def test_memo(monkeypatch):
+    monkeypatch.setattr(formatting, "_memo", formatting._Memo(max_bytes=200))
+    conversions = []
+    convert = formatting._convert
+    monkeypatch.setattr(formatting, "_convert", lambda text: conversions.append(text) or convert(text))
+
+    assert formatting.render_markdown("*foo*") == "<p><em>foo</em></p>"
+    assert formatting.render_markdown("*foo*") == "<p><em>foo</em></p>"
+    assert conversions == ["*foo*"]
+    stats = formatting.memo_stats()
+    assert (stats.hits, stats.misses, stats.items) == (1, 1, 1)
+
+    # The least recently used are forgotten to stay within budget.
+    for i in range(20):
+        formatting.render_markdown(f"note {i}")
+    formatting.render_markdown("note 19")
+    stats = formatting.memo_stats()
+    assert stats.bytes <= 200
+    assert stats.evictions > 0
+    assert stats.hits == 2
+    formatting.render_markdown("*foo*")
+    assert conversions.count("*foo*") == 2
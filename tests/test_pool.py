@@ -0,0 +1,124 @@
+import itertools
+import threading
+
+import pytest
+
+from komorebi import pool
+
+
+class FakeConnection:
+    def __init__(self, n: int):
+        self.n = n
+        self.closed = False
+        self.alive = True
+
+
+def make_pool(**kwargs) -> pool.ConnectionPool[FakeConnection]:
+    counter = itertools.count()
+
+    def ping(conn: FakeConnection) -> None:
+        if not conn.alive:
+            raise ConnectionError
+
+    def close(conn: FakeConnection) -> None:
+        conn.closed = True
+
+    return pool.ConnectionPool(
+        lambda: FakeConnection(next(counter)),
+        close=close,
+        ping=ping,
+        **kwargs,
+    )
+
+
+def test_reuse():
+    p = make_pool()
+    conn = p.acquire()
+    p.release(conn)
+    assert p.acquire() is conn
+    stats = p.stats()
+    assert stats.created == 1
+    assert stats.checkouts == 2
+    assert stats.in_use == 1
+
+
+def test_bad_bounds():
+    with pytest.raises(ValueError):
+        make_pool(min_size=2, max_size=1)
+
+
+def test_timeout():
+    p = make_pool(max_size=1, wait_timeout=0.01)
+    p.acquire()
+    with pytest.raises(pool.PoolTimeoutError):
+        p.acquire()
+    assert p.stats().timeouts == 1
+
+
+def test_wait_for_release():
+    p = make_pool(max_size=1, wait_timeout=5)
+    conn = p.acquire()
+    timer = threading.Timer(0.05, p.release, (conn,))
+    timer.start()
+    assert p.acquire() is conn
+    timer.join()
+    assert p.stats().waits == 1
+
+
+def test_dead_connection_replaced():
+    p = make_pool(ping_interval=0)
+    conn = p.acquire()
+    conn.alive = False
+    p.release(conn)
+    replacement = p.acquire()
+    assert replacement is not conn
+    assert conn.closed
+    assert p.stats().failed_pings == 1
+    assert p.stats().size == 1
+
+
+def test_idle_reaping():
+    p = make_pool(min_size=1, idle_timeout=0)
+    first = p.acquire()
+    second = p.acquire()
+    p.release(first)
+    p.release(second)
+    # The older of the two is reaped, but not below the minimum size.
+    assert p.acquire() is second
+    assert first.closed
+    assert p.stats().size == 1
+
+
+def test_discard_and_close():
+    p = make_pool()
+    conn = p.acquire()
+    p.release(conn, discard=True)
+    assert conn.closed
+    conn = p.acquire()
+    p.release(conn)
+    p.close()
+    assert conn.closed
+    assert p.stats().size == 0
+
+
+def test_min_size():
+    p = make_pool(min_size=2)
+    # Opened up front...
+    assert p.stats().idle == 2
+    first = p.acquire()
+    second = p.acquire()
+    assert (first.n, second.n) == (1, 0)
+    # ...and replaced when discarded.
+    p.release(first, discard=True)
+    stats = p.stats()
+    assert (stats.size, stats.idle, stats.created) == (2, 1, 3)
+
+
+def test_min_size_connect_failure():
+    def connect():
+        raise ConnectionError
+
+    p = pool.ConnectionPool(connect, close=lambda _: None, min_size=1)
+    assert p.stats().size == 0
+    with pytest.raises(ConnectionError):
+        p.acquire()
@@ -0,0 +1,78 @@
+from komorebi import db, search
+
+
+def test_tokenize():
+    assert list(search.tokenize("The Quick-Brown fox's example.com, and I")) == [
+        "quick-brown",
+        "foxs",
+        "example.com",
+    ]
+    assert list(search.tokenize(None)) == []
+    assert list(search.tokenize("x" * (search.MAX_TERM_LENGTH + 1))) == []
+
+
+def test_index_terms():
+    terms = search.index_terms("Python tips", "https://www.example.com/python", "More python")
+    assert terms == {
+        "python": search.TITLE_WEIGHT + search.NOTE_WEIGHT,
+        "tips": search.TITLE_WEIGHT,
+        "example.com": search.HOSTNAME_WEIGHT,
+        "example": search.HOSTNAME_WEIGHT,
+        "more": search.NOTE_WEIGHT,
+    }
+    # Overlong hostnames and labels are left out, as any other term would be.
+    label = "x" * 70
+    terms = search.index_terms("", f"https://{label}.example.com/", None)
+    assert terms == {"example": search.HOSTNAME_WEIGHT}
+    assert all(len(term) <= search.MAX_TERM_LENGTH for term in terms)
+
+
+def test_query_terms():
+    assert search.query_terms("python Python the tips") == ["python", "tips"]
+    assert len(search.query_terms(" ".join(f"term{i}" for i in range(20)))) == search.MAX_QUERY_TERMS
+
+
+def test_search_entries(sqlite_app):
+    with sqlite_app.app_context():
+        in_note = db.add_entry(link=None, title="Something", via=None, note="About python")
+        in_title = db.add_entry(link="https://example.com/", title="Python", via=None, note=None)
+        db.add_entry(link=None, title="Unrelated", via=None, note=None)
+        assert [entry["id"] for entry in db.search_entries(["python"])] == [in_title, in_note]
+        assert [entry["id"] for entry in db.search_entries(["python", "example"])] == [in_title]
+        assert [entry["id"] for entry in db.search_entries(["python"], offset=1, limit=1)] == [in_note]
+
+        # Updating an entry reindexes it.
+        db.update_entry(in_note, link=None, title="Something", via=None, note="About ruby")
+        assert [entry["id"] for entry in db.search_entries(["python"])] == [in_title]
+
+
+def test_rebuild_search(sqlite_app):
+    with sqlite_app.app_context():
+        entry_id = db.add_entry(link=None, title="Python", via=None, note=None)
+        db.get_connection().execute("DELETE FROM search_terms")
+        assert db.search_entries(["python"]) == []
+
+    result = sqlite_app.test_cli_runner().invoke(args=["komorebi", "rebuild-search"])
+    assert result.exit_code == 0
+    assert "Indexed 1 entries" in result.output
+
+    with sqlite_app.app_context():
+        assert [entry["id"] for entry in db.search_entries(["python"])] == [entry_id]
+
+
+def test_search_page(sqlite_app, monkeypatch):
+    monkeypatch.setattr(db, "PAGE_SIZE", 1)
+    with sqlite_app.app_context():
+        for i in range(2):
+            db.add_entry(link=None, title=f"Python {i}", via=None, note=None)
+
+    client = sqlite_app.test_client()
+    response = client.get("/search", query_string={"q": "python"})
+    assert response.status_code == 200
+    assert b"Python 1" in response.data
+    assert b'rel="next"' in response.data
+    response = client.get("/search", query_string={"q": "python", "page": 2})
+    assert b"Python 0" in response.data
+    assert b'rel="next"' not in response.data
+    assert client.get("/search", query_string={"q": "python", "page": 0}).status_code == 400
+    assert b"Nothing matched" in client.get("/search", query_string={"q": "ruby"}).data
@@ -0,0 +1,116 @@
+from flask_caching.backends import SimpleCache
+
+from komorebi import extensions, lru, tiered
+
+
+def test_tiers(monkeypatch):
+    shared = SimpleCache()
+    cache = tiered.TieredCache(shared, local_timeout=5)
+    now = 1000.0
+    monkeypatch.setattr(lru.time, "monotonic", lambda: now)
+
+    assert cache.get("a") is None
+    cache.set("a", "one")
+    assert cache.get("a") == "one"
+    # Served from memory, whatever the shared backend has.
+    shared.set("a", "two")
+    assert cache.get("a") == "one"
+    assert cache.get_many("a", "b") == ["one", None]
+
+    # Memory only holds on to values for so long.
+    now += 5
+    assert cache.get("a") == "two"
+
+    # Deletions go to both tiers.
+    cache.delete("a")
+    assert cache.get("a") is None
+    assert shared.get("a") is None
+
+    shared.set("b", "three")
+    assert cache.get_many("a", "b") == [None, "three"]
+    assert cache.get("b") == "three"
+
+    stats = cache.stats()
+    assert stats["local"]["hits"] == 4
+    assert stats["local"]["misses"] == 6
+    assert stats["shared"] == {"hits": 2, "misses": 4}
+    assert stats["local"]["items"] == 1
+
+
+def test_local_timeout_follows_shared_timeout(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(lru.time, "monotonic", lambda: now)
+    cache = tiered.TieredCache(SimpleCache(), local_timeout=60)
+    cache.set("a", "one", timeout=2)
+    now += 2
+    found, _ = cache._local.get("a")
+    assert not found
+
+
+def test_shared_values_keep_their_expiry(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(lru.time, "monotonic", lambda: now)
+    clock = tiered.time.time()
+    monkeypatch.setattr(tiered.time, "time", lambda: clock + now - 1000)
+    shared = SimpleCache()
+    # As if in two processes.
+    one = tiered.TieredCache(shared, local_timeout=60)
+    two = tiered.TieredCache(shared, local_timeout=60)
+    one.set("a", "one", timeout=10)
+    now += 8
+    assert two.get("a") == "one"
+    assert two.get_many("a") == ["one"]
+    # Kept in memory only for as long as it had left in the shared tier...
+    now += 2
+    assert not two._local.get("a")[0]
+    # ...and not served from it once that's up, even if it's still there.
+    assert shared.get("a") is not None
+    assert two.get("a") is None
+
+
+def test_has_follows_shared_tier():
+    shared = SimpleCache()
+    one = tiered.TieredCache(shared)
+    two = tiered.TieredCache(shared)
+    one.set("a", "one")
+    assert one.has("a")
+    two.delete("a")
+    assert not one.has("a")
+
+
+def test_eviction():
+    cache = tiered.TieredCache(SimpleCache(), max_bytes=8000)
+    for i in range(10):
+        cache.set(f"key{i}", "x" * 900)
+    # Keep the first one in use.
+    assert cache.get("key0") is not None
+    stats = cache.stats()["local"]
+    assert stats["bytes"] <= 8000
+    assert stats["evictions"] > 0
+    assert cache._local.get("key0")[0]
+    assert not cache._local.get("key1")[0]
+    # Anything too big for its share of memory is only cached in the shared tier.
+    cache.set("big", "x" * 2000)
+    assert not cache._local.get("big")[0]
+    assert cache.get("big") is not None
+
+
+def test_factory(sqlite_app, tmp_path):
+    extensions.cache.init_app(
+        sqlite_app,
+        config={
+            "CACHE_TYPE": "komorebi.tiered.TieredCache",
+            "CACHE_SHARED_TYPE": "FileSystemCache",
+            "CACHE_DIR": str(tmp_path / "cache"),
+            "CACHE_LOCAL_MAX_BYTES": 1024 * 1024,
+        },
+    )
+    with sqlite_app.app_context():
+        backend = extensions.cache.cache
+        assert isinstance(backend, tiered.TieredCache)
+        assert backend.stats()["local"]["max_bytes"] == 1024 * 1024
+        extensions.cache.set("a", {"value": 1})
+        assert backend.shared.get("a").value == {"value": 1}
+
+    response = sqlite_app.test_client().get("/")
+    assert response.status_code == 200
@@ -0,0 +1,60 @@
+from komorebi import caching, db, extensions, warmer
+
+
+def test_paths_for(sqlite_app):
+    paths = warmer.paths_for(sqlite_app, [2, 1], ["month:2020-01", "latest", "sitemap"])
+    assert paths == ["/", "/feed", "/2020-01", "/sitemap.xml", "/1", "/2"]
+
+
+def test_warmer(sqlite_app):
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+    with sqlite_app.app_context():
+        db.add_entry(link=None, title="Before", via=None, note=None)
+        db.commit()
+
+    instance = warmer.init_app(sqlite_app)
+    assert instance is not None
+    instance.join()
+    caching._deferred.join()
+    with sqlite_app.app_context():
+        record = extensions.cache.get("blog.latest")
+        assert b"Before" in record.bodies["identity"]
+        assert extensions.cache.get("view:/archive") is not None
+
+        # Pages affected by a change are rendered once it's committed.
+        entry_id = db.add_entry(link=None, title="After", via=None, note=None)
+        db.commit()
+    instance.join()
+    caching._deferred.join()
+    with sqlite_app.app_context():
+        assert b"After" in extensions.cache.get("blog.latest").bodies["identity"]
+        assert extensions.cache.get(f"db.entry:{entry_id}") is not None
+
+
+def test_warmed_urls(sqlite_app):
+    extensions.cache.init_app(sqlite_app, config={"CACHE_TYPE": "SimpleCache"})
+    sqlite_app.config.update({"SERVER_NAME": "blog.example.org", "PREFERRED_URL_SCHEME": "https"})
+    with sqlite_app.app_context():
+        db.add_entry(link=None, title="Linked", via=None, note=None)
+        db.commit()
+
+    instance = warmer.init_app(sqlite_app)
+    assert instance is not None
+    instance.join()
+    caching._deferred.join()
+    with sqlite_app.app_context():
+        page = extensions.cache.get("blog.latest").bodies["identity"]
+        feed = extensions.cache.get("view:/feed").bodies["identity"]
+    assert b'href="https://blog.example.org/site/feed"' in page
+    assert b"https://blog.example.org/site/" in feed
+    assert b"localhost" not in page + feed
+
+
+def test_warming_needs_server_name(sqlite_app):
+    sqlite_app.config["SERVER_NAME"] = None
+    assert warmer.init_app(sqlite_app) is None
+
+
+def test_warming_disabled(sqlite_app):
+    sqlite_app.config["CACHE_WARM"] = False
+    assert warmer.init_app(sqlite_app) is None